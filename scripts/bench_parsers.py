@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Offline microbenchmarks for the scraper's parsing hot paths.
+
+Runs each benchmark over the pages in bench_fixtures/ and reports
+throughput, p50/p95 latency and peak traced memory, compared with the
+stored bench_fixtures/baseline.json.
+
+    python scripts/bench_parsers.py                    # run and compare
+    python scripts/bench_parsers.py --check            # exit 1 on regression
+    python scripts/bench_parsers.py --update-baseline  # store this run
+    python scripts/bench_parsers.py --record           # refresh fixtures (network)
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest import mock
+
+import outputs
+import update_data
+from html_doc import parse_html
+from records import SnsPost
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "bench_fixtures"
+BASELINE_PATH = FIXTURE_DIR / "baseline.json"
+REGRESSION_THRESHOLD = 0.20
+RECORD_COUNT = 2000
+
+
+def load_fixture(name: str) -> str:
+    return (FIXTURE_DIR / name).read_text(encoding="utf-8")
+
+
+def fixed_fetch(html: str):
+    return mock.patch.object(update_data, "fetch_html", lambda url: html)
+
+
+def build_benchmarks() -> dict:
+    now = datetime(2026, 2, 21, tzinfo=timezone.utc)
+    benchmarks = {}
+
+    for shop in ("sanrio", "tamagotchi", "qlia"):
+        html = load_fixture(f"{shop}_detail.html")
+        doc = parse_html(html)
+        benchmarks[f"parse_product_html[{shop}]"] = (
+            lambda html=html: update_data.parse_product_html("https://example.com/item", html),
+            len(html),
+        )
+        benchmarks[f"extract_jsonld_product[{shop}]"] = (
+            lambda doc=doc: update_data.extract_jsonld_product(doc),
+            len(html),
+        )
+
+    for name, base_url, patterns in (
+        ("sanrio_list", update_data.SANRIO_LIST_URL, ["/item/detail/"]),
+        ("tamagotchi_list", update_data.TAMAGOTCHI_LIST_URL, ["/jp/item/"]),
+        ("qlia_category", update_data.QLIA_CATEGORY_URL, ["?pid="]),
+    ):
+        html = load_fixture(f"{name}.html")
+        benchmarks[f"extract_links[{name}]"] = (
+            lambda html=html, base_url=base_url, patterns=patterns: update_data.extract_links(html, base_url, patterns),
+            len(html),
+        )
+
+    yahoo_html = load_fixture("yahoo_realtime.html")
+
+    def run_yahoo():
+        with fixed_fetch(yahoo_html):
+            return update_data.search_yahoo_realtime(update_data.BONBON_BASE_KEYWORDS[0])
+
+    benchmarks["search_yahoo_realtime"] = (run_yahoo, len(yahoo_html))
+
+    ddg_html = load_fixture("duckduckgo.html")
+
+    def run_ddg():
+        with fixed_fetch(ddg_html):
+            return update_data.search_duckduckgo("query")
+
+    benchmarks["search_duckduckgo"] = (run_ddg, len(ddg_html))
+
+    # A long news archive that mentions the raffle once: the case the
+    # keyword windows are for. (raffle_page.html names it on every line.)
+    raffle_text = parse_html(load_fixture("raffle_news.html")).text()
+    benchmarks["extract_date_candidates"] = (
+        lambda: update_data.extract_date_candidates(raffle_text, now),
+        len(raffle_text),
+    )
+    benchmarks["extract_date_candidates[windowed]"] = (
+        lambda: update_data.extract_date_candidates(raffle_text, now, anchor=update_data.RAFFLE_KEYWORD),
+        len(raffle_text),
+    )
+
+    oembed_html = json.loads(load_fixture("oembed.json"))["html"]
+    benchmarks["_strip_html[oembed]"] = (lambda: update_data._strip_html(oembed_html), len(oembed_html))
+
+    # Building posts as validated records vs plain dicts, and encoding them.
+    posts = [sample_post(index) for index in range(RECORD_COUNT)]
+    payload = outputs.serialize(posts)
+    # The writer uses whichever encoder is installed, and may be handed
+    # records or dicts: every combination has to give the same bytes.
+    records = [SnsPost.from_json(post) for post in posts]
+    if {outputs.serialize(records), outputs.serialize_stdlib(records), outputs.serialize_stdlib(posts)} != {payload}:
+        raise SystemExit("serialize: encoders disagree on the sample posts")
+    benchmarks[f"build_posts[dict x{RECORD_COUNT}]"] = (
+        lambda: [sample_post(index) for index in range(RECORD_COUNT)],
+        len(payload),
+    )
+    benchmarks[f"build_posts[SnsPost x{RECORD_COUNT}]"] = (
+        lambda: [SnsPost.from_json(sample_post(index)) for index in range(RECORD_COUNT)],
+        len(payload),
+    )
+    benchmarks["serialize[json]"] = (lambda: outputs.serialize_stdlib(posts), len(payload))
+    if outputs.orjson is not None:
+        benchmarks["serialize[orjson]"] = (lambda: outputs.serialize(posts), len(payload))
+    return benchmarks
+
+
+def sample_post(index: int) -> dict:
+    return {
+        "id": f"x_{1900000000000000000 + index}",
+        "type": "twitter",
+        "productId": f"x_{1900000000000000000 + index}",
+        "username": f"@user{index % 97}",
+        "content": f"\u30dc\u30f3\u30dc\u30f3\u30c9\u30ed\u30c3\u30d7 \u5165\u8377 {index}",
+        "imageUrl": None,
+        "postUrl": f"https://x.com/user{index % 97}/status/{1900000000000000000 + index}",
+        "postedAt": "2026-02-21T09:00:00+00:00",
+        "storeName": None,
+        "location": None,
+        "price": None,
+        "isVerified": False,
+    }
+
+
+def measure(func, size: int, min_seconds: float, min_iterations: int) -> dict:
+    for _ in range(3):
+        func()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < min_iterations or time.perf_counter() - started < min_seconds:
+        begin = time.perf_counter_ns()
+        func()
+        samples.append(time.perf_counter_ns() - begin)
+    total_seconds = sum(samples) / 1e9
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    quantiles = statistics.quantiles(samples, n=20)
+    return {
+        "iterations": len(samples),
+        "opsPerSec": round(len(samples) / total_seconds, 1),
+        "mbPerSec": round(size * len(samples) / total_seconds / 1e6, 2),
+        "p50Us": round(statistics.median(samples) / 1000, 1),
+        "p95Us": round(quantiles[18] / 1000, 1),
+        "peakKb": round(peak / 1024, 1),
+    }
+
+
+def compare(name: str, result: dict, baseline: dict | None) -> tuple[str, bool]:
+    if not baseline:
+        return "(no baseline)", False
+    change = result["p50Us"] / baseline["p50Us"] - 1 if baseline.get("p50Us") else 0.0
+    regressed = change > REGRESSION_THRESHOLD
+    return f"{change:+.0%} p50 vs baseline" + (" REGRESSION" if regressed else ""), regressed
+
+
+def record_fixtures() -> None:
+    def save(name: str, body: str) -> None:
+        (FIXTURE_DIR / name).write_text(body, encoding="utf-8")
+        print(f"recorded {name} ({len(body)} bytes)")
+
+    for name, url, patterns in (
+        ("sanrio", update_data.SANRIO_LIST_URL, ["/item/detail/"]),
+        ("tamagotchi", update_data.TAMAGOTCHI_LIST_URL, ["/jp/item/"]),
+        ("qlia", update_data.QLIA_CATEGORY_URL, ["?pid="]),
+    ):
+        html = update_data.fetch_html(url)
+        save(f"{name}_category.html" if name == "qlia" else f"{name}_list.html", html)
+        links = [link for link in update_data.extract_links(html, url, patterns) if link != url]
+        if links:
+            save(f"{name}_detail.html", update_data.fetch_html(links[0]))
+
+    keyword = update_data.BONBON_BASE_KEYWORDS[0]
+    yahoo_html = update_data.fetch_html(
+        "https://search.yahoo.co.jp/realtime/search?p=" + update_data.quote(keyword) + "&ei=UTF-8"
+    )
+    save("yahoo_realtime.html", yahoo_html)
+    statuses = update_data.scan_x_statuses(yahoo_html, limit=1)
+    if statuses:
+        save(
+            "oembed.json",
+            update_data.fetch_html(
+                "https://publish.twitter.com/oembed?omit_script=1&url=" + update_data.quote(statuses[0].url, safe="")
+            ),
+        )
+
+    query = "ボンボンドロップシール 抽選"
+    ddg_html = update_data.fetch_html("https://duckduckgo.com/html/?q=" + update_data.quote(query))
+    save("duckduckgo.html", ddg_html)
+    with fixed_fetch(ddg_html):
+        results = update_data.search_duckduckgo(query)
+    if results:
+        save("raffle_page.html", update_data.fetch_html(results[0]["url"]))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true", help="refresh fixtures from the live sites")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--check", action="store_true", help="exit non-zero on a p50 regression")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--min-seconds", type=float, default=0.5)
+    parser.add_argument("--min-iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures()
+        return 0
+
+    try:
+        baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        baseline = {}
+
+    results = {}
+    regressions = []
+    for name, (func, size) in build_benchmarks().items():
+        if args.filter not in name:
+            continue
+        result = measure(func, size, args.min_seconds, args.min_iterations)
+        results[name] = result
+        note, regressed = compare(name, result, baseline.get("results", {}).get(name))
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:40s} {result['opsPerSec']:>10.1f} ops/s {result['mbPerSec']:>8.2f} MB/s"
+            f" p50 {result['p50Us']:>9.1f}us p95 {result['p95Us']:>9.1f}us"
+            f" peak {result['peakKb']:>8.1f}KB  {note}"
+        )
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(
+            json.dumps(
+                {"htmlBackend": parse_html("").backend, "python": sys.version.split()[0], "results": results},
+                indent=2,
+                sort_keys=True,
+            ) + "\n",
+            encoding="utf-8",
+        )
+        print(f"baseline written to {BASELINE_PATH}")
+
+    if regressions and args.check:
+        print("regressions: " + ", ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,79 @@
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from json_state import JsonState
+
+
+class RunCheckpoint(JsonState):
+    """Progress of the current update run, flushed to disk while it runs.
+
+    Every stage keeps the items it has finished, keyed by URL or query, and
+    its result once it has run to the end. A run that finds a checkpoint
+    younger than max_age resumes from it: finished stages are not rerun and
+    streaming stages skip the items they already handled. The file is
+    removed once the outputs have been written.
+    """
+
+    def __init__(self, path: Path, max_age: timedelta = timedelta(hours=3), flush_interval: float = 5.0):
+        super().__init__(path)
+        self.max_age = max_age
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        self.dirty = False
+
+    def _empty(self) -> dict:
+        return {"startedAt": datetime.now(timezone.utc).isoformat(), "stages": {}}
+
+    def _accept(self, data: dict) -> dict:
+        started = datetime.fromisoformat(data["startedAt"])
+        if datetime.now(timezone.utc) - started > self.max_age:
+            raise ValueError("stale checkpoint")
+        return data
+
+    def _stage(self, name: str) -> dict:
+        return self._load()["stages"].setdefault(name, {"items": {}})
+
+    @property
+    def resumed_stages(self) -> list[str]:
+        with self.lock:
+            return sorted(self._load()["stages"])
+
+    def items(self, stage: str) -> dict:
+        with self.lock:
+            return dict(self._stage(stage)["items"])
+
+    def add(self, stage: str, key: str, value) -> None:
+        with self.lock:
+            self._stage(stage)["items"][key] = value
+            self.dirty = True
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self._flush()
+
+    def result(self, stage: str) -> tuple[bool, object]:
+        with self.lock:
+            entry = self._stage(stage)
+            return "result" in entry, entry.get("result")
+
+    def complete(self, stage: str, result) -> None:
+        with self.lock:
+            self._load()["stages"][stage] = {"items": {}, "result": result}
+            self.dirty = True
+            self._flush()
+
+    def _flush(self) -> None:
+        self.last_flush = time.monotonic()
+        if self.data is None or not self.dirty:
+            return
+        self._write()
+        self.dirty = False
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data = None
+            self.dirty = False
+            self.path.unlink(missing_ok=True)
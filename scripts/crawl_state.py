@@ -0,0 +1,91 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from json_state import JsonState
+
+
+def content_fingerprint(html: str) -> str:
+    return hashlib.sha1(" ".join(html.split()).encode("utf-8")).hexdigest()
+
+
+class CrawlState(JsonState):
+    """Last parsed result per product id, reused while the page is unchanged.
+
+    An entry is reused when its fingerprint matches the freshly fetched page
+    and it was parsed less than max_age ago. Entries not seen for
+    forget_after are dropped on save so delisted products do not pile up.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_age: timedelta = timedelta(hours=24),
+        forget_after: timedelta = timedelta(days=14),
+    ):
+        super().__init__(path)
+        self.max_age = max_age
+        self.forget_after = forget_after
+        self.reused = 0
+        self.parsed = 0
+
+    def _reuse(self, entry: dict | None, modified: datetime | None = None) -> dict | None:
+        now = datetime.now(timezone.utc)
+        if not entry:
+            return None
+        try:
+            parsed_at = datetime.fromisoformat(entry["parsedAt"])
+        except (KeyError, ValueError):
+            return None
+        if now - parsed_at > self.max_age or (modified and modified > parsed_at):
+            return None
+        entry["seenAt"] = now.isoformat()
+        self.reused += 1
+        return dict(entry["product"])
+
+    def lookup(self, key: str, fingerprint: str) -> dict | None:
+        with self.lock:
+            entry = self._load().get(key)
+            if not entry or entry.get("fingerprint") != fingerprint:
+                return None
+            return self._reuse(entry)
+
+    def lookup_unmodified(self, key: str, modified: datetime) -> dict | None:
+        """Reuse without fetching when the page's lastmod predates the last parse.
+
+        Sold-out products are always refetched: shops rarely bump lastmod
+        when stock changes, and a restock is what matters most.
+        """
+        with self.lock:
+            entry = self._load().get(key)
+            if entry and not entry.get("product", {}).get("in_stock", True):
+                return None
+            return self._reuse(entry, modified)
+
+    def snapshot(self) -> dict[str, dict]:
+        with self.lock:
+            return {key: dict(entry) for key, entry in self._load().items()}
+
+    def record(self, key: str, url: str, fingerprint: str, product: dict) -> None:
+        now = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            self._load()[key] = {
+                "url": url,
+                "fingerprint": fingerprint,
+                "parsedAt": now,
+                "seenAt": now,
+                "product": dict(product),
+            }
+            self.parsed += 1
+
+    def save(self) -> None:
+        with self.lock:
+            if self.data is None:
+                return
+            cutoff = datetime.now(timezone.utc) - self.forget_after
+            self.data = {
+                key: entry
+                for key, entry in self.data.items()
+                if entry.get("seenAt", "") >= cutoff.isoformat()
+            }
+            self._write()
@@ -0,0 +1,56 @@
+import time
+from pathlib import Path
+
+from json_state import JsonState
+
+
+class EnrichmentCache(JsonState):
+    """Status ID -> enriched post text, stored as gzipped compact JSON.
+
+    Tweet text does not change, so hits never expire; they are only dropped
+    once unused for forget_after seconds. Failed lookups are cached as None
+    and retried after negative_ttl seconds, or after the shorter ttl given
+    to record for a lookup that could not be finished.
+    """
+
+    compress = True
+
+    def __init__(
+        self,
+        path: Path,
+        negative_ttl: float = 6 * 3600,
+        forget_after: float = 30 * 86400,
+    ):
+        super().__init__(path)
+        self.negative_ttl = negative_ttl
+        self.forget_after = forget_after
+
+    def lookup(self, status_id: str) -> tuple[bool, str | None]:
+        now = time.time()
+        with self.lock:
+            entry = self._load().get(status_id)
+            if entry is None:
+                return False, None
+            text, checked_at, *ttl = entry
+            if text is None and now - checked_at > (ttl[0] if ttl else self.negative_ttl):
+                return False, None
+            if text is not None:
+                entry[1] = now
+            return True, text
+
+    def record(self, status_id: str, text: str | None, ttl: float | None = None) -> None:
+        entry = [text, time.time()]
+        if text is None and ttl is not None:
+            entry.append(ttl)
+        with self.lock:
+            self._load()[status_id] = entry
+
+    def save(self) -> None:
+        with self.lock:
+            if self.data is None:
+                return
+            cutoff = time.time() - self.forget_after
+            self.data = {
+                key: entry for key, entry in self.data.items() if entry[1] >= cutoff
+            }
+            self._write()
@@ -0,0 +1,299 @@
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    image_url TEXT NOT NULL,
+    description TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_last_seen ON products (last_seen);
+
+CREATE TABLE IF NOT EXISTS price_observations (
+    product_id TEXT NOT NULL,
+    store_id TEXT NOT NULL,
+    store_name TEXT NOT NULL,
+    price REAL NOT NULL,
+    in_stock INTEGER NOT NULL,
+    location TEXT,
+    url TEXT NOT NULL,
+    observed_at TEXT NOT NULL,
+    PRIMARY KEY (product_id, store_id, observed_at)
+);
+CREATE INDEX IF NOT EXISTS price_observations_store ON price_observations (store_id, observed_at);
+
+CREATE TABLE IF NOT EXISTS sns_posts (
+    feed TEXT NOT NULL,
+    id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    product_id TEXT,
+    username TEXT NOT NULL,
+    content TEXT NOT NULL,
+    image_url TEXT,
+    post_url TEXT NOT NULL,
+    posted_at TEXT NOT NULL,
+    posted_ts REAL NOT NULL,
+    store_name TEXT,
+    location TEXT,
+    price REAL,
+    is_verified INTEGER NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    PRIMARY KEY (feed, id)
+);
+CREATE INDEX IF NOT EXISTS sns_posts_id ON sns_posts (id);
+CREATE INDEX IF NOT EXISTS sns_posts_feed_posted ON sns_posts (feed, posted_ts);
+CREATE INDEX IF NOT EXISTS sns_posts_store ON sns_posts (store_name, posted_ts);
+CREATE INDEX IF NOT EXISTS sns_posts_location ON sns_posts (location, posted_ts);
+"""
+
+
+def _timestamp(value: str) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class HistoryStore:
+    """SQLite (WAL) history of products, price/stock changes and SNS posts.
+
+    Price observations are only inserted when price or stock differs from
+    the latest row, so lastUpdated in the export is the time of the last
+    change. compact() drops posts and observations past their retention
+    while always keeping the latest observation per product and store.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def record_products(self, products: list[dict], seen_at: str) -> None:
+        product_rows = []
+        price_rows = []
+        for product in products:
+            product_rows.append((
+                product["id"],
+                product["name"],
+                product["category"],
+                product["imageUrl"],
+                product["description"],
+                seen_at,
+                seen_at,
+            ))
+            for price in product.get("prices", []):
+                price_rows.append((
+                    product["id"],
+                    price["storeId"],
+                    price["storeName"],
+                    price["price"],
+                    int(price["inStock"]),
+                    price.get("location"),
+                    price["url"],
+                    price.get("lastUpdated") or seen_at,
+                ))
+
+        with self.connection:
+            self.connection.executemany(
+                """
+                INSERT INTO products (id, name, category, image_url, description, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    name = excluded.name,
+                    category = excluded.category,
+                    image_url = excluded.image_url,
+                    description = excluded.description,
+                    last_seen = excluded.last_seen
+                """,
+                product_rows,
+            )
+            # Skip rows identical to the latest observation for that product/store.
+            self.connection.executemany(
+                """
+                INSERT OR IGNORE INTO price_observations
+                    (product_id, store_id, store_name, price, in_stock, location, url, observed_at)
+                SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM (
+                        SELECT price, in_stock, store_name, location, url FROM price_observations
+                        WHERE product_id = ?1 AND store_id = ?2
+                        ORDER BY observed_at DESC LIMIT 1
+                    ) AS latest
+                    WHERE latest.price = ?4 AND latest.in_stock = ?5 AND latest.store_name = ?3
+                        AND latest.location IS ?6 AND latest.url = ?7
+                )
+                """,
+                price_rows,
+            )
+
+    def _products_where(self, clause: str, params: tuple) -> list[dict]:
+        products = {}
+        rows = self.connection.execute(
+            f"""
+            SELECT p.id, p.name, p.category, p.image_url, p.description,
+                   o.store_id, o.store_name, o.price, o.in_stock, o.location, o.url, o.observed_at
+            FROM products AS p
+            JOIN price_observations AS o ON o.product_id = p.id
+            WHERE {clause}
+              AND o.observed_at = (
+                SELECT MAX(observed_at) FROM price_observations
+                WHERE product_id = o.product_id AND store_id = o.store_id
+              )
+            ORDER BY p.name, p.id, o.store_id
+            """,
+            params,
+        )
+        for (product_id, name, category, image_url, description,
+             store_id, store_name, price, in_stock, location, url, observed_at) in rows:
+            product = products.setdefault(product_id, {
+                "id": product_id,
+                "name": name,
+                "category": category,
+                "imageUrl": image_url,
+                "description": description,
+                "prices": [],
+            })
+            product["prices"].append({
+                "storeId": store_id,
+                "storeName": store_name,
+                "price": price,
+                "inStock": bool(in_stock),
+                "location": location,
+                "url": url,
+                "lastUpdated": observed_at,
+            })
+        return list(products.values())
+
+    def products_seen_at(self, seen_at: str) -> list[dict]:
+        return self._products_where("p.last_seen = ?", (seen_at,))
+
+    def latest_products(self) -> list[dict]:
+        return self._products_where("p.last_seen = (SELECT MAX(last_seen) FROM products)", ())
+
+    def record_posts(self, feed: str, posts: list[dict], seen_at: str) -> None:
+        rows = [
+            (
+                feed,
+                post["id"],
+                post["type"],
+                post.get("productId"),
+                post["username"],
+                post["content"],
+                post.get("imageUrl"),
+                post["postUrl"],
+                post["postedAt"],
+                _timestamp(post["postedAt"]),
+                post.get("storeName"),
+                post.get("location"),
+                post.get("price"),
+                int(bool(post.get("isVerified"))),
+                seen_at,
+                seen_at,
+            )
+            for post in posts
+        ]
+        with self.connection:
+            self.connection.executemany(
+                """
+                INSERT INTO sns_posts (
+                    feed, id, type, product_id, username, content, image_url, post_url,
+                    posted_at, posted_ts, store_name, location, price, is_verified, first_seen, last_seen
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (feed, id) DO UPDATE SET
+                    type = excluded.type,
+                    product_id = excluded.product_id,
+                    username = excluded.username,
+                    content = excluded.content,
+                    image_url = excluded.image_url,
+                    post_url = excluded.post_url,
+                    posted_at = excluded.posted_at,
+                    posted_ts = excluded.posted_ts,
+                    store_name = excluded.store_name,
+                    location = excluded.location,
+                    price = excluded.price,
+                    is_verified = excluded.is_verified,
+                    last_seen = excluded.last_seen
+                """,
+                rows,
+            )
+
+    def feed_posts(self, feed: str, since: datetime) -> list[dict]:
+        rows = self.connection.execute(
+            """
+            SELECT id, type, product_id, username, content, image_url, post_url,
+                   posted_at, store_name, location, price, is_verified
+            FROM sns_posts
+            WHERE feed = ? AND posted_ts >= ?
+            ORDER BY posted_ts DESC, id
+            """,
+            (feed, since.timestamp()),
+        )
+        return [
+            {
+                "id": post_id,
+                "type": post_type,
+                "productId": product_id,
+                "username": username,
+                "content": content,
+                "imageUrl": image_url,
+                "postUrl": post_url,
+                "postedAt": posted_at,
+                "storeName": store_name,
+                "location": location,
+                "price": price,
+                "isVerified": bool(is_verified),
+            }
+            for (post_id, post_type, product_id, username, content, image_url, post_url,
+                 posted_at, store_name, location, price, is_verified) in rows
+        ]
+
+    def compact(self, now: datetime, post_retention: timedelta, observation_retention: timedelta) -> None:
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM sns_posts WHERE posted_ts < ?",
+                ((now - post_retention).timestamp(),),
+            )
+            cutoff = (now - observation_retention).isoformat()
+            self.connection.execute(
+                """
+                DELETE FROM price_observations
+                WHERE product_id IN (SELECT id FROM products WHERE last_seen < ?)
+                """,
+                (cutoff,),
+            )
+            self.connection.execute("DELETE FROM products WHERE last_seen < ?", (cutoff,))
+            self.connection.execute(
+                """
+                DELETE FROM price_observations AS o
+                WHERE observed_at < ?
+                  AND observed_at < (
+                    SELECT MAX(observed_at) FROM price_observations
+                    WHERE product_id = o.product_id AND store_id = o.store_id
+                  )
+                """,
+                (cutoff,),
+            )
+        page_count = self.connection.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+        if page_count and free_pages > page_count // 4:
+            self.connection.execute("VACUUM")
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
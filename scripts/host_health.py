@@ -0,0 +1,154 @@
+import email.utils
+import random
+import threading
+import time
+from collections import deque
+from datetime import timezone
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    now = time.time() if now is None else now
+    return max(0.0, when.timestamp() - now)
+
+
+class _Host:
+    __slots__ = ("latencies", "failures", "opened_at", "probing", "not_before", "skipped", "trips", "retries")
+
+    def __init__(self, window: int):
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+        self.not_before = 0.0
+        self.skipped = 0
+        self.trips = 0
+        self.retries = 0
+
+
+class HostHealth:
+    """Circuit breaker, adaptive timeout and retry delays per host.
+
+    After failure_threshold consecutive failures (errors, timeouts, 403s,
+    or 5xx/429 left after retrying) a host's circuit opens and calls to it are
+    refused for cooldown seconds. Then one probe is let through; success
+    closes the circuit, failure opens it again. Timeouts follow the host's
+    observed latency: timeout_factor times the recent p95, clamped to
+    [min_timeout, max_timeout], and max_timeout until min_samples responses
+    have been seen.
+    """
+
+    def __init__(
+        self,
+        max_timeout: float = 20.0,
+        min_timeout: float = 3.0,
+        timeout_factor: float = 4.0,
+        min_samples: int = 8,
+        window: int = 100,
+        failure_threshold: int = 5,
+        cooldown: float = 120.0,
+        backoff_base: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.timeout_factor = timeout_factor
+        self.min_samples = min_samples
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.backoff_base = backoff_base
+        self.max_delay = max_delay
+        self.hosts: dict[str, _Host] = {}
+        self.lock = threading.Lock()
+
+    def _host(self, host: str) -> _Host:
+        entry = self.hosts.get(host)
+        if entry is None:
+            entry = self.hosts[host] = _Host(self.window)
+        return entry
+
+    def allow(self, host: str) -> bool:
+        """False while the host's circuit is open; counts the skipped call."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self._host(host)
+            if entry.opened_at is None:
+                return True
+            if now - entry.opened_at >= self.cooldown and not entry.probing:
+                entry.probing = True
+                return True
+            entry.skipped += 1
+            return False
+
+    def is_open(self, host: str) -> bool:
+        with self.lock:
+            return self._host(host).opened_at is not None
+
+    def timeout(self, host: str) -> float:
+        with self.lock:
+            latencies = sorted(self._host(host).latencies)
+        if len(latencies) < self.min_samples:
+            return self.max_timeout
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return min(self.max_timeout, max(self.min_timeout, p95 * self.timeout_factor))
+
+    def wait(self, host: str) -> None:
+        """Sleep until a Retry-After the host sent to any caller has passed."""
+        with self.lock:
+            delay = self._host(host).not_before - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def retry_delay(self, host: str, attempt: int, retry_after: float | None = None) -> float:
+        """Full-jitter exponential backoff, or the server's Retry-After if longer."""
+        delay = random.uniform(0, min(self.max_delay, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(self.max_delay, retry_after))
+            with self.lock:
+                entry = self._host(host)
+                entry.not_before = max(entry.not_before, time.monotonic() + delay)
+        with self.lock:
+            self._host(host).retries += 1
+        return delay
+
+    def record_success(self, host: str, latency: float) -> None:
+        with self.lock:
+            entry = self._host(host)
+            entry.latencies.append(latency)
+            entry.failures = 0
+            entry.opened_at = None
+            entry.probing = False
+
+    def record_failure(self, host: str) -> None:
+        with self.lock:
+            entry = self._host(host)
+            entry.failures += 1
+            if entry.probing or (entry.opened_at is None and entry.failures >= self.failure_threshold):
+                entry.opened_at = time.monotonic()
+                entry.trips += 1
+            entry.probing = False
+
+    def summary(self) -> list[str]:
+        lines = []
+        with self.lock:
+            for host, entry in sorted(self.hosts.items()):
+                if not (entry.trips or entry.skipped or entry.retries):
+                    continue
+                state = "open" if entry.opened_at is not None else "closed"
+                lines.append(
+                    f"{host}: circuit {state} (tripped {entry.trips}x), "
+                    f"{entry.skipped} calls skipped, {entry.retries} retries"
+                )
+        return lines
@@ -0,0 +1,130 @@
+import os
+
+from bs4 import BeautifulSoup
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml  # noqa: F401
+
+    SOUP_FEATURES = "lxml"
+except ImportError:
+    SOUP_FEATURES = "html.parser"
+
+# Elements whose contents bs4's get_text() leaves out; the lexbor backend
+# skips them too so every backend extracts the same page text.
+NON_TEXT_TAGS = frozenset({"script", "style"})
+
+
+class SoupNode:
+    def __init__(self, node):
+        self.node = node
+
+    def attr(self, name: str) -> str | None:
+        return self.node.get(name)
+
+    def text(self) -> str:
+        return self.node.get_text(" ", strip=True)
+
+    def select(self, selector: str) -> list["SoupNode"]:
+        return [SoupNode(node) for node in self.node.select(selector)]
+
+    def select_one(self, selector: str) -> "SoupNode | None":
+        node = self.node.select_one(selector)
+        return SoupNode(node) if node is not None else None
+
+
+class LexborNode:
+    def __init__(self, node):
+        self.node = node
+
+    def attr(self, name: str) -> str | None:
+        return self.node.attributes.get(name)
+
+    def text(self) -> str:
+        # Like get_text(" ", strip=True): whitespace-only strings are dropped,
+        # and script/style contents only count when asked for directly.
+        if self.node.tag in NON_TEXT_TAGS:
+            return self.node.text(strip=True)
+        parts = []
+        for node in self.node.traverse(include_text=True):
+            if node.is_text_node and node.parent.tag not in NON_TEXT_TAGS:
+                part = node.text_content.strip()
+                if part:
+                    parts.append(part)
+        return " ".join(parts)
+
+    def select(self, selector: str) -> list["LexborNode"]:
+        return [LexborNode(node) for node in self.node.css(selector)]
+
+    def select_one(self, selector: str) -> "LexborNode | None":
+        node = self.node.css_first(selector)
+        return LexborNode(node) if node is not None else None
+
+
+class Document:
+    """One parsed HTML document shared by every extractor that needs it."""
+
+    backend = ""
+
+    def __init__(self, root):
+        self.root = root
+        self._text = None
+
+    def select(self, selector: str) -> list:
+        return self.root.select(selector) if self.root else []
+
+    def select_one(self, selector: str):
+        return self.root.select_one(selector) if self.root else None
+
+    def title(self) -> str | None:
+        node = self.select_one("title")
+        return node.text() if node else None
+
+    def meta(self, key: str) -> str | None:
+        node = self.select_one(f'meta[property="{key}"]') or self.select_one(f'meta[name="{key}"]')
+        return node.attr("content") if node else None
+
+    def jsonld_blocks(self) -> list[str]:
+        return [
+            node.text()
+            for node in self.select('script[type="application/ld+json"]')
+        ]
+
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.root.text() if self.root else ""
+        return self._text
+
+
+class SoupDocument(Document):
+    def __init__(self, html: str, features: str = SOUP_FEATURES):
+        super().__init__(SoupNode(BeautifulSoup(html, features)))
+        self.backend = features
+
+
+class LexborDocument(Document):
+    backend = "selectolax"
+
+    def __init__(self, html: str):
+        tree = LexborHTMLParser(html)
+        super().__init__(LexborNode(tree.root) if tree.root is not None else None)
+
+
+# Fastest available backend unless HTML_PARSER_BACKEND forces one of
+# "selectolax", "lxml" or "html.parser".
+DEFAULT_BACKEND = os.environ.get("HTML_PARSER_BACKEND") or (
+    "selectolax" if LexborHTMLParser is not None else SOUP_FEATURES
+)
+
+
+def parse_html(html: str, backend: str | None = None) -> Document:
+    backend = backend or DEFAULT_BACKEND
+    if backend == "selectolax" and LexborHTMLParser is not None:
+        return LexborDocument(html)
+    if backend == "html.parser":
+        return SoupDocument(html, "html.parser")
+    return SoupDocument(html)
@@ -0,0 +1,74 @@
+import hashlib
+import time
+from pathlib import Path
+
+from json_state import JsonState
+
+
+class HttpCache(JsonState):
+    """URL-keyed response cache that revalidates with ETag / Last-Modified.
+
+    Bodies live as one file per URL under root, with a JSON index holding the
+    validators, size and last access time. save() evicts least recently used
+    entries until the total body size fits in max_bytes.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = 64 * 1024 * 1024):
+        super().__init__(root / "index.json")
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _body_path(self, url: str) -> Path:
+        return self.root / (hashlib.sha1(url.encode("utf-8")).hexdigest() + ".body")
+
+    def conditional_headers(self, url: str) -> dict:
+        with self.lock:
+            entry = self._load().get(url)
+        if not entry:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def get(self, url: str) -> str | None:
+        with self.lock:
+            entry = self._load().get(url)
+            if not entry:
+                return None
+            try:
+                body = self._body_path(url).read_text(encoding="utf-8")
+            except OSError:
+                self.data.pop(url, None)
+                return None
+            entry["accessed"] = time.time()
+            return body
+
+    def store(self, url: str, body: str, etag: str | None, last_modified: str | None) -> None:
+        if not etag and not last_modified:
+            return
+        data = body.encode("utf-8")
+        with self.lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._body_path(url).write_bytes(data)
+            self._load()[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "size": len(data),
+                "accessed": time.time(),
+            }
+
+    def save(self) -> None:
+        with self.lock:
+            if self.data is None:
+                return
+            total = sum(entry.get("size", 0) for entry in self.data.values())
+            for url, entry in sorted(self.data.items(), key=lambda item: item[1].get("accessed", 0)):
+                if total <= self.max_bytes:
+                    break
+                self._body_path(url).unlink(missing_ok=True)
+                total -= entry.get("size", 0)
+                del self.data[url]
+            self._write()
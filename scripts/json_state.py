@@ -0,0 +1,48 @@
+import gzip
+import json
+import threading
+from pathlib import Path
+
+
+class JsonState:
+    """A JSON document on disk, loaded on first use and replaced atomically.
+
+    Subclasses keep their state in self.data, reached through _load() while
+    holding self.lock, and call _write() (also under the lock) to persist
+    it. A missing or unreadable file, or one _accept() rejects by raising,
+    loads as _empty(). With compress=True the file is gzipped.
+    """
+
+    compress = False
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.data = None
+        self.lock = threading.Lock()
+
+    def _empty(self):
+        return {}
+
+    def _accept(self, data):
+        return data
+
+    def _open(self, path: Path, mode: str):
+        if self.compress:
+            return gzip.open(path, mode + "t", encoding="utf-8")
+        return path.open(mode, encoding="utf-8")
+
+    def _load(self):
+        if self.data is None:
+            try:
+                with self._open(self.path, "r") as handle:
+                    self.data = self._accept(json.load(handle))
+            except (OSError, ValueError, KeyError, TypeError):
+                self.data = self._empty()
+        return self.data
+
+    def _write(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with self._open(tmp_path, "w") as handle:
+            json.dump(self.data, handle, ensure_ascii=False, separators=(",", ":"))
+        tmp_path.replace(self.path)
@@ -0,0 +1,74 @@
+import html as html_lib
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Iterator, NamedTuple
+
+ANCHOR_HREF_PATTERN = re.compile(
+    r"""<a\b[^>]*?\shref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""",
+    re.IGNORECASE,
+)
+# Status links and relative times ("5分前") are matched by one alternation so
+# a results page is scanned exactly once.
+X_SCAN_PATTERN = re.compile(
+    r"https://(?:twitter\.com|x\.com)/(?P<user>[A-Za-z0-9_]+)/status/(?P<status>\d+)"
+    r"|(?P<ago>\d+\s*(?:分|時間|日)前)"
+)
+RELATIVE_TIME_WINDOW = 200
+
+
+class StatusLink(NamedTuple):
+    url: str
+    username: str
+    status_id: str
+    relative_time: str | None
+
+
+def iter_hrefs(html: str) -> Iterator[str]:
+    for match in ANCHOR_HREF_PATTERN.finditer(html):
+        href = match.group(1) or match.group(2) or match.group(3)
+        if href:
+            yield html_lib.unescape(href) if "&" in href else href
+
+
+@lru_cache(maxsize=64)
+def token_pattern(tokens: tuple[str, ...]) -> re.Pattern:
+    return re.compile("(?:" + "|".join(map(re.escape, tokens)) + r")[^\"'\s>]*")
+
+
+def iter_token_urls(html: str, tokens: tuple[str, ...]) -> Iterator[str]:
+    for match in token_pattern(tokens).finditer(html):
+        yield match.group(0)
+
+
+def scan_x_statuses(html: str, limit: int | None = None) -> list[StatusLink]:
+    hits = []
+    seen = set()
+    ago_starts = []
+    ago_matches = []
+
+    for match in X_SCAN_PATTERN.finditer(html):
+        if limit is not None and len(hits) >= limit and match.start() > hits[-1].end() + RELATIVE_TIME_WINDOW:
+            break
+        if match.lastgroup == "ago":
+            ago_starts.append(match.start())
+            ago_matches.append(match)
+            continue
+        url = match.group(0)
+        if url in seen or (limit is not None and len(hits) >= limit):
+            continue
+        seen.add(url)
+        hits.append(match)
+
+    results = []
+    for match in hits:
+        window_start = match.start() - RELATIVE_TIME_WINDOW
+        window_end = match.end() + RELATIVE_TIME_WINDOW
+        relative_time = None
+        index = bisect_left(ago_starts, window_start)
+        if index < len(ago_matches) and ago_matches[index].end() <= window_end:
+            relative_time = ago_matches[index].group("ago")
+        results.append(
+            StatusLink(match.group(0), match.group("user"), match.group("status"), relative_time)
+        )
+    return results
@@ -0,0 +1,85 @@
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+def load_previous(path: Path) -> list[dict]:
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return []
+    return [item for item in data if isinstance(item, dict)] if isinstance(data, list) else []
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def merge_posts(
+    previous: list[dict],
+    current: list[dict],
+    now: datetime,
+    retention: timedelta,
+    is_placeholder,
+) -> list[dict]:
+    """Fold this run's posts into the previous feed.
+
+    Known IDs keep their first-seen postedAt and any enriched content the
+    new scrape lacks; posts older than the retention window are dropped.
+    The result is ordered newest first with the ID as tie-breaker so an
+    unchanged feed serializes to identical bytes.
+    """
+    merged = {post["id"]: dict(post) for post in previous if post.get("id")}
+    for post in current:
+        old = merged.get(post["id"])
+        post = dict(post)
+        if old:
+            old_time = _parse_time(old.get("postedAt"))
+            new_time = _parse_time(post.get("postedAt"))
+            if old_time and (not new_time or old_time <= new_time):
+                post["postedAt"] = old["postedAt"]
+            if is_placeholder(post) and not is_placeholder(old):
+                post["content"] = old["content"]
+        merged[post["id"]] = post
+
+    cutoff = now - retention
+    kept = [
+        post for post in merged.values()
+        if (posted := _parse_time(post.get("postedAt"))) is None or posted >= cutoff
+    ]
+    kept.sort(key=lambda post: post["id"])
+    kept.sort(key=_post_timestamp, reverse=True)
+    return kept
+
+
+def _post_timestamp(post: dict) -> float:
+    posted = _parse_time(post.get("postedAt"))
+    return posted.timestamp() if posted else 0.0
+
+
+def merge_products(previous: list[dict], current: list[dict]) -> list[dict]:
+    """Carry lastUpdated forward for price entries whose values did not change."""
+    previous_prices = {}
+    for product in previous:
+        for price in product.get("prices", []):
+            previous_prices[(product.get("id"), price.get("storeId"))] = price
+
+    merged = []
+    for product in current:
+        product = dict(product)
+        prices = []
+        for price in product.get("prices", []):
+            old = previous_prices.get((product["id"], price.get("storeId")))
+            if old and {**old, "lastUpdated": None} == {**price, "lastUpdated": None}:
+                price = {**price, "lastUpdated": old["lastUpdated"]}
+            prices.append(price)
+        product["prices"] = prices
+        merged.append(product)
+    merged.sort(key=lambda product: (product["name"], product["id"]))
+    return merged
@@ -0,0 +1,204 @@
+import contextvars
+import cProfile
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+SLOWEST_PARSES = 10
+
+current_stage: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_stage", default=None)
+
+
+class RunMetrics:
+    """Per-stage, per-host and per-document timings for one update run.
+
+    Stage CPU time is thread CPU time summed over the stage's own thread
+    and every worker that ran on its behalf (see track_worker), so stages
+    that overlap in wall time are still attributed separately.
+    """
+
+    def __init__(self, profile_stage: str | None = None):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages: dict[str, dict] = {}
+        self.hosts: dict[str, dict] = {}
+        self.parses: dict[str, dict] = {}
+        self.profile_stage = profile_stage
+        self.profile: pstats.Stats | None = None
+
+    def _stage_entry(self, name: str) -> dict:
+        return self.stages.setdefault(name, {"wallSeconds": 0.0, "cpuSeconds": 0.0})
+
+    def _add_profile(self, profiler: cProfile.Profile) -> None:
+        with self.lock:
+            if self.profile is None:
+                self.profile = pstats.Stats(profiler)
+            else:
+                self.profile.add(profiler)
+
+    @contextmanager
+    def _cpu_scope(self, name: str):
+        profiler = None
+        if name == self.profile_stage:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        cpu_started = time.thread_time()
+        try:
+            yield
+        finally:
+            cpu = time.thread_time() - cpu_started
+            if profiler:
+                profiler.disable()
+                self._add_profile(profiler)
+            with self.lock:
+                self._stage_entry(name)["cpuSeconds"] += cpu
+
+    @contextmanager
+    def stage(self, name: str):
+        token = current_stage.set(name)
+        wall_started = time.perf_counter()
+        try:
+            with self._cpu_scope(name):
+                yield
+        finally:
+            wall = time.perf_counter() - wall_started
+            current_stage.reset(token)
+            with self.lock:
+                self._stage_entry(name)["wallSeconds"] += wall
+
+    @contextmanager
+    def track_worker(self):
+        name = current_stage.get()
+        if name is None:
+            yield
+            return
+        with self._cpu_scope(name):
+            yield
+
+    def _host_entry(self, host: str) -> dict:
+        return self.hosts.setdefault(host, {
+            "requests": 0,
+            "bytes": 0,
+            "errors": 0,
+            "retries": 0,
+            "skipped": 0,
+            "statuses": {},
+            "latencySum": 0.0,
+            "latencyBuckets": [0] * (len(LATENCY_BUCKETS) + 1),
+        })
+
+    def record_request(self, host: str, status: int | None, size: int, latency: float) -> None:
+        with self.lock:
+            entry = self._host_entry(host)
+            entry["requests"] += 1
+            entry["bytes"] += size
+            entry["latencySum"] += latency
+            status_key = str(status) if status is not None else "error"
+            entry["statuses"][status_key] = entry["statuses"].get(status_key, 0) + 1
+            if status is None or status >= 400:
+                entry["errors"] += 1
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    entry["latencyBuckets"][index] += 1
+                    break
+            else:
+                entry["latencyBuckets"][-1] += 1
+
+    def record_retry(self, host: str) -> None:
+        with self.lock:
+            self._host_entry(host)["retries"] += 1
+
+    def record_skip(self, host: str) -> None:
+        with self.lock:
+            self._host_entry(host)["skipped"] += 1
+
+    @contextmanager
+    def parse(self, kind: str, document: str = "", size: int = 0):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                entry = self.parses.setdefault(kind, {"count": 0, "seconds": 0.0, "bytes": 0, "slowest": []})
+                entry["count"] += 1
+                entry["seconds"] += elapsed
+                entry["bytes"] += size
+                slowest = entry["slowest"]
+                slowest.append({"document": document, "seconds": round(elapsed, 6), "bytes": size})
+                slowest.sort(key=lambda item: -item["seconds"])
+                del slowest[SLOWEST_PARSES:]
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "wallSeconds": round(time.perf_counter() - self.started, 3),
+                "stages": {
+                    name: {key: round(value, 4) for key, value in entry.items()}
+                    for name, entry in sorted(self.stages.items())
+                },
+                "hosts": {
+                    host: {
+                        **entry,
+                        "latencySum": round(entry["latencySum"], 4),
+                        "latencyBuckets": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], entry["latencyBuckets"])),
+                    }
+                    for host, entry in sorted(self.hosts.items())
+                },
+                "parses": {
+                    kind: {**entry, "seconds": round(entry["seconds"], 4)}
+                    for kind, entry in sorted(self.parses.items())
+                },
+            }
+
+    def prometheus(self) -> str:
+        data = self.snapshot()
+        lines = [
+            "# TYPE card_tracker_run_wall_seconds gauge",
+            f"card_tracker_run_wall_seconds {data['wallSeconds']}",
+            "# TYPE card_tracker_stage_wall_seconds gauge",
+        ]
+        lines += [f'card_tracker_stage_wall_seconds{{stage="{name}"}} {entry["wallSeconds"]}' for name, entry in data["stages"].items()]
+        lines.append("# TYPE card_tracker_stage_cpu_seconds gauge")
+        lines += [f'card_tracker_stage_cpu_seconds{{stage="{name}"}} {entry["cpuSeconds"]}' for name, entry in data["stages"].items()]
+
+        lines.append("# TYPE card_tracker_http_requests_total counter")
+        for host, entry in data["hosts"].items():
+            for status, count in sorted(entry["statuses"].items()):
+                lines.append(f'card_tracker_http_requests_total{{host="{host}",status="{status}"}} {count}')
+        for metric, key in (
+            ("card_tracker_http_response_bytes_total", "bytes"),
+            ("card_tracker_http_errors_total", "errors"),
+            ("card_tracker_http_retries_total", "retries"),
+            ("card_tracker_http_skipped_total", "skipped"),
+        ):
+            lines.append(f"# TYPE {metric} counter")
+            lines += [f'{metric}{{host="{host}"}} {entry[key]}' for host, entry in data["hosts"].items()]
+
+        lines.append("# TYPE card_tracker_http_request_duration_seconds histogram")
+        for host, entry in data["hosts"].items():
+            cumulative = 0
+            for bound, count in entry["latencyBuckets"].items():
+                cumulative += count
+                lines.append(f'card_tracker_http_request_duration_seconds_bucket{{host="{host}",le="{bound}"}} {cumulative}')
+            lines.append(f'card_tracker_http_request_duration_seconds_sum{{host="{host}"}} {entry["latencySum"]}')
+            lines.append(f'card_tracker_http_request_duration_seconds_count{{host="{host}"}} {entry["requests"]}')
+
+        lines.append("# TYPE card_tracker_parse_seconds summary")
+        for kind, entry in data["parses"].items():
+            lines.append(f'card_tracker_parse_seconds_sum{{kind="{kind}"}} {entry["seconds"]}')
+            lines.append(f'card_tracker_parse_seconds_count{{kind="{kind}"}} {entry["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / "metrics.json").write_text(
+            json.dumps(self.snapshot(), ensure_ascii=False, indent=2) + "\n", encoding="utf-8"
+        )
+        (directory / "metrics.prom").write_text(self.prometheus(), encoding="utf-8")
+        if self.profile is not None:
+            self.profile.dump_stats(directory / f"profile-{self.profile_stage}.prof")
@@ -0,0 +1,111 @@
+import hashlib
+import re
+import unicodedata
+from collections.abc import Callable
+
+SIMHASH_BITS = 64
+MAX_DISTANCE = 6
+# Fingerprints within MAX_DISTANCE bits agree on at least one of
+# MAX_DISTANCE + 1 disjoint slices (pigeonhole).
+BANDS = MAX_DISTANCE + 1
+SHINGLE_SIZE = 3
+MIN_TEXT_CHARS = 20
+
+URL_PATTERN = re.compile(r"https?://\S+")
+NOISE_PATTERN = re.compile(r"[\s#＃@＠!！?？、。,.・…~〜ー\-]+")
+
+# SPREAD[byte] puts each of the byte's bits in its own LANE_BITS-wide lane,
+# so adding spread bytes counts set bits for eight positions at once.
+LANE_BITS = 24
+LANE_MASK = (1 << LANE_BITS) - 1
+SPREAD = [sum((byte >> bit & 1) << (LANE_BITS * bit) for bit in range(8)) for byte in range(256)]
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower()
+    return NOISE_PATTERN.sub("", URL_PATTERN.sub("", text))
+
+
+def simhash(text: str) -> int:
+    counts = {}
+    for index in range(max(1, len(text) - SHINGLE_SIZE + 1)):
+        shingle = text[index:index + SHINGLE_SIZE]
+        counts[shingle] = counts.get(shingle, 0) + 1
+    lanes = [0] * (SIMHASH_BITS // 8)
+    total = 0
+    for shingle, count in counts.items():
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=SIMHASH_BITS // 8).digest()
+        for position, byte in enumerate(digest):
+            lanes[position] += SPREAD[byte] * count
+        total += count
+    fingerprint = 0
+    for position, lane in enumerate(lanes):
+        for bit in range(8):
+            if 2 * (lane >> (LANE_BITS * bit) & LANE_MASK) > total:
+                fingerprint |= 1 << (position * 8 + bit)
+    return fingerprint
+
+
+def cluster_texts(texts: list[str | None]) -> list[list[int]]:
+    """Groups of indexes whose texts are near-duplicates, in input order.
+
+    Only items sharing a band bucket are compared, and identical
+    fingerprints are merged up front, so the cost stays close to linear
+    in the number of texts. None, and texts shorter
+    than MIN_TEXT_CHARS after normalization, are never clustered.
+    """
+    parent = list(range(len(texts)))
+
+    def find(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    def union(left: int, right: int) -> None:
+        left, right = find(left), find(right)
+        if left != right:
+            parent[max(left, right)] = min(left, right)
+
+    by_fingerprint = {}
+    for index, text in enumerate(texts):
+        normalized = normalize_text(text) if text else ""
+        if len(normalized) < MIN_TEXT_CHARS:
+            continue
+        fingerprint = simhash(normalized)
+        if fingerprint in by_fingerprint:
+            union(by_fingerprint[fingerprint], index)
+        else:
+            by_fingerprint[fingerprint] = index
+
+    band_bits = SIMHASH_BITS // BANDS
+    mask = (1 << band_bits) - 1
+    buckets = {}
+    for fingerprint, index in by_fingerprint.items():
+        for band in range(BANDS):
+            key = (band, fingerprint >> (band * band_bits) & mask)
+            for other_fingerprint, other in buckets.get(key, ()):
+                if (fingerprint ^ other_fingerprint).bit_count() <= MAX_DISTANCE:
+                    union(index, other)
+            buckets.setdefault(key, []).append((fingerprint, index))
+
+    groups = {}
+    for index in range(len(texts)):
+        groups.setdefault(find(index), []).append(index)
+    return list(groups.values())
+
+
+def collapse_near_duplicates(posts: list[dict], eligible: Callable[[dict], bool]) -> list[dict]:
+    """One post per near-duplicate cluster, keeping feed order.
+
+    The first post of a cluster (the newest, in a newest-first feed) is
+    kept and gets duplicateCount; ineligible posts pass through untouched.
+    """
+    texts = [post.get("content") if eligible(post) else None for post in posts]
+    collapsed = []
+    for group in cluster_texts(texts):
+        post = posts[group[0]]
+        if len(group) > 1:
+            post = {**post, "duplicateCount": len(group)}
+        collapsed.append(post)
+    return collapsed
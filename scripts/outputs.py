@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import json
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MANIFEST_VERSION = 1
+
+
+def _to_json(value):
+    if hasattr(value, "to_json"):
+        return value.to_json()
+    raise TypeError(f"cannot serialize {type(value).__name__}")
+
+
+def serialize_stdlib(payload) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_to_json).encode("utf-8")
+
+
+def serialize(payload) -> bytes:
+    # Both encoders produce the same bytes for these payloads (compact,
+    # unescaped UTF-8), so switching between them never shows up as a diff.
+    # orjson would encode dataclasses itself, with their snake_case field
+    # names; passing them through sends records to to_json() like json does.
+    if orjson is not None:
+        return orjson.dumps(payload, default=_to_json, option=orjson.OPT_PASSTHROUGH_DATACLASS)
+    return serialize_stdlib(payload)
+
+
+def _write_bytes(path: Path, data: bytes) -> dict:
+    # Leave identical files untouched so unchanged runs produce no diff.
+    if not (path.exists() and path.read_bytes() == data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return {"size": len(data)}
+
+
+def write_output(path: Path, payload, base_dir: Path) -> dict:
+    """Write minified UTF-8 JSON plus .gz / .br siblings; return its manifest entry."""
+    data = serialize(payload)
+    entry = {
+        "path": path.relative_to(base_dir).as_posix(),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        **_write_bytes(path, data),
+    }
+    # mtime=0 keeps the gzip bytes stable when the JSON is unchanged.
+    gz_path = path.with_name(path.name + ".gz")
+    entry["gzip"] = {"path": gz_path.relative_to(base_dir).as_posix(), **_write_bytes(gz_path, gzip.compress(data, 9, mtime=0))}
+    if brotli is not None:
+        br_path = path.with_name(path.name + ".br")
+        entry["br"] = {"path": br_path.relative_to(base_dir).as_posix(), **_write_bytes(br_path, brotli.compress(data))}
+    return entry
+
+
+def shard_key(post: dict, by: str) -> str:
+    if by == "day":
+        return (post.get("postedAt") or "")[:10] or "unknown"
+    if by == "location":
+        return post.get("location") or "unknown"
+    raise ValueError(f"unknown shard mode: {by}")
+
+
+def shard_file_name(key: str, by: str) -> str:
+    if key.isascii():
+        return f"{by}-{key}.json"
+    return f"{by}-{hashlib.md5(key.encode('utf-8')).hexdigest()[:8]}.json"
+
+
+def write_shards(output_dir: Path, name: str, posts: list[dict], by: str) -> dict:
+    shards: dict[str, list[dict]] = {}
+    for post in posts:
+        shards.setdefault(shard_key(post, by), []).append(post)
+
+    shard_dir = output_dir / "shards" / name
+    written = set()
+    files = {}
+    for key in sorted(shards):
+        path = shard_dir / shard_file_name(key, by)
+        files[key] = write_output(path, shards[key], output_dir)
+        written.update({path.name, path.name + ".gz", path.name + ".br"})
+
+    if shard_dir.exists():
+        for stale in shard_dir.iterdir():
+            if stale.name not in written:
+                stale.unlink()
+    return {"by": by, "files": files}
+
+
+def write_manifest(output_dir: Path, files: dict, shards: dict) -> None:
+    manifest = {"version": MANIFEST_VERSION, "files": files, "shards": shards}
+    data = (json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True) + "\n").encode("utf-8")
+    _write_bytes(output_dir / "manifest.json", data)
@@ -0,0 +1,270 @@
+from pathlib import Path
+from typing import NamedTuple
+
+from json_state import JsonState
+
+
+class PlannedQuery(NamedTuple):
+    query: str
+    label: str
+    keywords: tuple[str, ...]
+    # The merged query a single-city query belongs to, if any.
+    group: str | None = None
+
+
+class QueryPlanner(JsonState):
+    """Plans the realtime search fan-out from per-query yield history.
+
+    City keywords that share a base term and a prefecture are merged into a
+    single OR query, so adding a city widens an existing query instead of
+    adding a request. Queries are ordered by their smoothed yield, and
+    queries that returned nothing for skip_after_runs runs are skipped except
+    on every probe_every-th run, when everything is re-checked.
+
+    One results page covers fewer posts per city than a query per city, so
+    probe runs also search each merged group's cities one by one and
+    measure the merged query's recall against their union. A group whose
+    recall is below min_merge_recall is searched city by city until a later
+    probe shows merging is safe again.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        merge_cities: bool = True,
+        skip_after_runs: int = 3,
+        min_yield: float = 0.5,
+        probe_every: int = 6,
+        alpha: float = 0.3,
+        min_merge_recall: float = 0.9,
+    ):
+        super().__init__(path)
+        self.merge_cities = merge_cities
+        self.skip_after_runs = skip_after_runs
+        self.min_yield = min_yield
+        self.probe_every = probe_every
+        self.alpha = alpha
+        self.min_merge_recall = min_merge_recall
+        self.reports: list[dict] = []
+
+    def _feed(self, feed: str) -> dict:
+        return self._load().setdefault(feed, {"runs": 0, "queries": {}})
+
+    def _group(self, keywords: list[str], cities: dict[str, str]) -> list[PlannedQuery]:
+        groups: dict[tuple[str, str | None], list[tuple[str, str]]] = {}
+        for keyword in keywords:
+            term, _, city = keyword.rpartition(" ")
+            if self.merge_cities and term and city in cities:
+                key = (term, cities[city])
+            else:
+                key = (keyword, None)
+            groups.setdefault(key, []).append((keyword, city))
+
+        queries = []
+        for (term, prefecture), members in groups.items():
+            if prefecture is None or len(members) == 1:
+                keyword = members[0][0]
+                queries.append(PlannedQuery(keyword, keyword, (keyword,)))
+                continue
+            query = f"{term} (" + " OR ".join(city for _, city in members) + ")"
+            queries.append(PlannedQuery(query, members[0][0], tuple(keyword for keyword, _ in members)))
+        return queries
+
+    @staticmethod
+    def _members(query: PlannedQuery) -> list[PlannedQuery]:
+        return [PlannedQuery(keyword, keyword, (keyword,), query.query) for keyword in query.keywords]
+
+    def is_probe_run(self, feed: str) -> bool:
+        """Whether this run re-checks every query; callers must not defer any of them."""
+        with self.lock:
+            return self._feed(feed)["runs"] % self.probe_every == 0
+
+    def plan(self, feed: str, keywords: list[str], cities: dict[str, str]) -> list[PlannedQuery]:
+        probe = self.is_probe_run(feed)
+        with self.lock:
+            feed_state = self._feed(feed)
+            stats = feed_state["queries"]
+            split = set(feed_state.get("split", []))
+
+        candidates = []
+        compare = {}
+        for query in self._group(keywords, cities):
+            if len(query.keywords) == 1:
+                candidates.append(query)
+            elif probe:
+                candidates += [query, *self._members(query)]
+                compare[query.query] = list(query.keywords)
+            elif query.query in split:
+                candidates += self._members(query)
+            else:
+                candidates.append(query)
+
+        selected = []
+        skipped = []
+        for query in candidates:
+            entry = stats.get(query.query)
+            if (
+                not probe
+                and entry
+                and entry.get("runs", 0) >= self.skip_after_runs
+                and entry.get("emptyRuns", 0) >= self.skip_after_runs
+                and entry.get("yield", 0.0) < self.min_yield
+            ):
+                skipped.append(query)
+            else:
+                selected.append(query)
+
+        # Unknown queries first so they get measured, then by expected yield.
+        selected.sort(key=lambda query: -stats.get(query.query, {}).get("yield", float("inf")))
+        with self.lock:
+            feed_state["lastPlan"] = {
+                "naiveQueries": len(keywords),
+                "probe": probe,
+                "merged": [list(query.keywords) for query in candidates if len(query.keywords) > 1],
+                "split": sorted(split),
+                "compare": compare,
+                "skipped": [query.query for query in skipped],
+            }
+        return selected
+
+    def _smooth(self, previous: float, value: float, runs: int) -> float:
+        if runs <= 1:
+            return float(value)
+        return (1 - self.alpha) * previous + self.alpha * value
+
+    def record(
+        self,
+        feed: str,
+        results: list[tuple[PlannedQuery, list[str] | None]],
+        not_run: list[PlannedQuery] = (),
+        truncated: bool = False,
+    ) -> dict:
+        """Update the feed's history from one run; urls of None mark a failed query.
+
+        not_run lists planned queries that sent no request, whether the
+        refresh scheduler deferred them or the run was cut short. They are
+        left out of the stats and the recall estimate, and since the rest of
+        the plan ran without them, exclusive shares are not updated either.
+        A truncated run (deadline, open circuit) updates no stats at all and
+        does not count towards the probe cadence.
+        """
+        counts: dict[str, int] = {}
+        for _, urls in results:
+            for url in set(urls or []):
+                counts[url] = counts.get(url, 0) + 1
+        unique_posts = len(counts)
+        full_plan = not not_run
+
+        with self.lock:
+            feed_state = self._feed(feed)
+            stats = feed_state["queries"]
+            if not truncated:
+                feed_state["runs"] += 1
+            query_reports = []
+            for query, urls in results:
+                if urls is None:
+                    query_reports.append({"query": query.query, "error": True})
+                    continue
+                hits = set(urls)
+                exclusive = sum(1 for url in hits if counts[url] == 1)
+                if not truncated:
+                    entry = stats.setdefault(query.query, {"runs": 0, "emptyRuns": 0, "yield": 0.0, "exclusive": 0.0})
+                    entry["runs"] += 1
+                    entry["emptyRuns"] = 0 if hits else entry["emptyRuns"] + 1
+                    entry["yield"] = self._smooth(entry["yield"], len(hits), entry["runs"])
+                    if full_plan:
+                        entry["exclusiveRuns"] = entry.get("exclusiveRuns", 0) + 1
+                        entry["exclusive"] = self._smooth(entry["exclusive"], exclusive, entry["exclusiveRuns"])
+                query_report = {"query": query.query, "hits": len(hits)}
+                if full_plan:
+                    query_report["exclusive"] = exclusive
+                    query_report["overlap"] = round(1 - exclusive / len(hits), 3) if hits else 0.0
+                query_reports.append(query_report)
+
+            query_reports += [{"query": query.query, "notRun": True} for query in not_run]
+
+            last_plan = feed_state.get("lastPlan", {})
+            compare = {} if truncated else last_plan.get("compare", {})
+            group_recall = self._record_merge_recall(feed_state, results, compare) if compare else {}
+
+            estimated_missed = sum(stats.get(query, {}).get("exclusive", 0.0) for query in last_plan.get("skipped", []))
+            # Posts a merged query most likely missed, from its recall at
+            # the last probe.
+            for query, urls in results:
+                recall = stats.get(query.query, {}).get("mergeRecall")
+                if urls and recall and query.query not in compare:
+                    estimated_missed += len(set(urls)) * (1 / recall - 1)
+
+            merge_recall = None
+            if compare:
+                # Unique posts the usual merged plan would have found this
+                # run, against everything the probe found.
+                members = {keyword for keywords in compare.values() for keyword in keywords}
+                merged_plan = {url for query, urls in results if query.query not in members for url in urls or []}
+                merge_recall = round(len(merged_plan) / unique_posts, 3) if unique_posts else None
+            report = {
+                "feed": feed,
+                **last_plan,
+                "plannedQueries": len(results) + len(not_run),
+                "notRun": len(not_run),
+                "truncated": truncated,
+                "uniquePosts": unique_posts,
+                "mergeRecall": merge_recall,
+                "groupRecall": group_recall,
+                "estimatedMissed": round(estimated_missed, 1),
+                # Unknown for a truncated run: the queries it did not reach
+                # may have no history to estimate their share from.
+                "estimatedRecall": (
+                    round(unique_posts / (unique_posts + estimated_missed), 3) if unique_posts and not truncated else None
+                ),
+                "queries": query_reports,
+            }
+            feed_state["lastReport"] = report
+            self.reports.append(report)
+        return report
+
+    def _record_merge_recall(
+        self,
+        feed_state: dict,
+        results: list[tuple[PlannedQuery, list[str] | None]],
+        compare: dict[str, list[str]],
+    ) -> dict[str, float]:
+        """Recall of each compared merged query against its cities' union; updates the split set."""
+        hits = {query.query: set(urls) for query, urls in results if urls is not None}
+        split = set(feed_state.get("split", []))
+        group_recall = {}
+        for merged, members in compare.items():
+            # Needs the merged query and every city; a failed or unscheduled
+            # one would make the union look smaller than it is.
+            if merged not in hits or any(member not in hits for member in members):
+                continue
+            union = hits[merged].union(*(hits[member] for member in members))
+            recall = len(hits[merged]) / len(union) if union else 1.0
+            group_recall[merged] = round(recall, 3)
+            feed_state["queries"][merged]["mergeRecall"] = recall
+            if recall < self.min_merge_recall:
+                split.add(merged)
+            else:
+                split.discard(merged)
+        feed_state["split"] = sorted(split)
+        return group_recall
+
+    def save(self) -> None:
+        with self.lock:
+            if self.data is not None:
+                self._write()
+
+
+def format_report(report: dict) -> str:
+    recall = report.get("estimatedRecall")
+    return (
+        f"[planner] {report['feed']}: {report['plannedQueries']}/{report.get('naiveQueries', '?')} queries"
+        f" ({len(report.get('merged', []))} merged groups, {len(report.get('skipped', []))} skipped"
+        f"{', probe run' if report.get('probe') else ''}),"
+        f" {report['uniquePosts']} unique posts,"
+        + (f" {report['notRun']} queries not run," if report.get("notRun") else "")
+        + (" stopped early, stats unchanged," if report.get("truncated") else "")
+        + f" est. recall {recall if recall is not None else 'n/a'}"
+        + (f", merged-query recall {report['mergeRecall']}" if report.get("mergeRecall") is not None else "")
+        + (f", {len(report['split'])} groups split" if report.get("split") else "")
+    )
@@ -0,0 +1,41 @@
+import time
+from datetime import datetime
+from pathlib import Path
+
+from json_state import JsonState
+
+
+class RaffleDateCache(JsonState):
+    """Raffle date resolved from a result page, per URL, with a TTL.
+
+    Pages where no date was found are cached too, with the shorter
+    negative_ttl, so a dead or dateless page is not refetched every run.
+    """
+
+    def __init__(self, path: Path, ttl: float = 24 * 3600, negative_ttl: float = 6 * 3600):
+        super().__init__(path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        ttl = self.ttl if entry.get("date") else self.negative_ttl
+        return now - entry.get("checkedAt", 0) > ttl
+
+    def lookup(self, url: str) -> tuple[bool, datetime | None]:
+        with self.lock:
+            entry = self._load().get(url)
+        if not entry or self._expired(entry, time.time()):
+            return False, None
+        return True, datetime.fromisoformat(entry["date"]) if entry.get("date") else None
+
+    def record(self, url: str, date: datetime | None) -> None:
+        with self.lock:
+            self._load()[url] = {"date": date.isoformat() if date else None, "checkedAt": time.time()}
+
+    def save(self) -> None:
+        with self.lock:
+            if self.data is None:
+                return
+            now = time.time()
+            self.data = {url: entry for url, entry in self.data.items() if not self._expired(entry, now)}
+            self._write()
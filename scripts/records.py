@@ -0,0 +1,175 @@
+"""Typed product and post records, validated when they are built.
+
+The JSON exports, the checkpoint and the history store all speak plain
+dicts in the app's camelCase schema, so records are built where data enters
+the pipeline, which is where a malformed product or post is rejected, and
+handed on through to_json(); from_json() reads an export entry back.
+Validation is the point: the pipeline holds dicts, not records.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+POST_TYPES = ("twitter", "instagram", "line", "other")
+
+
+def _require_text(value, field: str) -> None:
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"{field} must be a non-empty string, got {value!r}")
+
+
+def _require_optional_text(value, field: str) -> None:
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{field} must be a string or None, got {value!r}")
+
+
+def _require_timestamp(value, field: str) -> None:
+    _require_text(value, field)
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{field} must be an ISO 8601 timestamp, got {value!r}") from None
+
+
+@dataclass(slots=True, frozen=True)
+class PriceEntry:
+    store_id: str
+    store_name: str
+    price: float
+    in_stock: bool
+    url: str
+    last_updated: str
+    location: str | None = None
+
+    def __post_init__(self):
+        _require_text(self.store_id, "storeId")
+        _require_text(self.store_name, "storeName")
+        _require_text(self.url, "url")
+        _require_timestamp(self.last_updated, "lastUpdated")
+        _require_optional_text(self.location, "location")
+        if not isinstance(self.price, (int, float)) or isinstance(self.price, bool) or self.price < 0:
+            raise ValueError(f"price must be a non-negative number, got {self.price!r}")
+        if not isinstance(self.in_stock, bool):
+            raise ValueError(f"inStock must be a bool, got {self.in_stock!r}")
+
+    def to_json(self) -> dict:
+        return {
+            "storeId": self.store_id,
+            "storeName": self.store_name,
+            "price": float(self.price),
+            "inStock": self.in_stock,
+            "location": self.location,
+            "url": self.url,
+            "lastUpdated": self.last_updated,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "PriceEntry":
+        return cls(
+            store_id=data["storeId"],
+            store_name=data["storeName"],
+            price=data["price"],
+            in_stock=data["inStock"],
+            url=data["url"],
+            last_updated=data["lastUpdated"],
+            location=data.get("location"),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class Product:
+    id: str
+    name: str
+    category: str
+    image_url: str
+    description: str
+    prices: tuple[PriceEntry, ...]
+
+    def __post_init__(self):
+        _require_text(self.id, "id")
+        _require_text(self.name, "name")
+        _require_text(self.category, "category")
+        if not isinstance(self.image_url, str) or not isinstance(self.description, str):
+            raise ValueError("imageUrl and description must be strings")
+        if not self.prices or not all(isinstance(price, PriceEntry) for price in self.prices):
+            raise ValueError(f"prices must be a non-empty tuple of PriceEntry for {self.id}")
+
+    def to_json(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "category": self.category,
+            "imageUrl": self.image_url,
+            "description": self.description,
+            "prices": [price.to_json() for price in self.prices],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Product":
+        return cls(
+            id=data["id"],
+            name=data["name"],
+            category=data["category"],
+            image_url=data["imageUrl"],
+            description=data["description"],
+            prices=tuple(PriceEntry.from_json(price) for price in data["prices"]),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class SnsPost:
+    id: str
+    type: str
+    product_id: str
+    username: str
+    content: str
+    post_url: str
+    posted_at: str
+    image_url: str | None = None
+    store_name: str | None = None
+    location: str | None = None
+    price: float | None = None
+    is_verified: bool = False
+
+    def __post_init__(self):
+        for field in ("id", "product_id", "username", "content", "post_url"):
+            _require_text(getattr(self, field), field)
+        if self.type not in POST_TYPES:
+            raise ValueError(f"type must be one of {POST_TYPES}, got {self.type!r}")
+        _require_timestamp(self.posted_at, "postedAt")
+        for field in ("image_url", "store_name", "location"):
+            _require_optional_text(getattr(self, field), field)
+        if self.price is not None and (not isinstance(self.price, (int, float)) or isinstance(self.price, bool)):
+            raise ValueError(f"price must be a number or None, got {self.price!r}")
+
+    def to_json(self) -> dict:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "productId": self.product_id,
+            "username": self.username,
+            "content": self.content,
+            "imageUrl": self.image_url,
+            "postUrl": self.post_url,
+            "postedAt": self.posted_at,
+            "storeName": self.store_name,
+            "location": self.location,
+            "price": self.price,
+            "isVerified": self.is_verified,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "SnsPost":
+        return cls(
+            id=data["id"],
+            type=data["type"],
+            product_id=data["productId"],
+            username=data["username"],
+            content=data["content"],
+            post_url=data["postUrl"],
+            posted_at=data["postedAt"],
+            image_url=data.get("imageUrl"),
+            store_name=data.get("storeName"),
+            location=data.get("location"),
+            price=data.get("price"),
+            is_verified=bool(data.get("isVerified")),
+        )
@@ -0,0 +1,81 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from json_state import JsonState
+
+
+def result_fingerprint(items) -> str:
+    return hashlib.sha1(json.dumps(items, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class RefreshScheduler(JsonState):
+    """Next-due time per source, backed off while its results do not change.
+
+    Every fetch records a fingerprint of the source's results. A changed
+    result puts the source back on base_interval; each unchanged one
+    doubles its interval up to the longest max_intervals prefix match (or
+    default_max). A source counts as due within tolerance of its nextDue,
+    so cron jitter never costs a whole extra period.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        base_interval: timedelta = timedelta(hours=1),
+        max_intervals: dict[str, timedelta] | None = None,
+        default_max: timedelta = timedelta(hours=6),
+        tolerance: timedelta = timedelta(minutes=10),
+        alpha: float = 0.3,
+    ):
+        super().__init__(path)
+        self.base_interval = base_interval
+        self.max_intervals = max_intervals or {}
+        self.default_max = default_max
+        self.tolerance = tolerance
+        self.alpha = alpha
+        self.force = False
+        self.deferred: list[str] = []
+
+    def max_interval(self, source: str) -> timedelta:
+        matches = [prefix for prefix in self.max_intervals if source.startswith(prefix)]
+        return self.max_intervals[max(matches, key=len)] if matches else self.default_max
+
+    def is_due(self, source: str, now: datetime | None = None) -> bool:
+        now = now or datetime.now(timezone.utc)
+        with self.lock:
+            entry = self._load().get(source)
+            if self.force or not entry:
+                return True
+            try:
+                due = now >= datetime.fromisoformat(entry["nextDue"]) - self.tolerance
+            except (KeyError, ValueError):
+                return True
+            if not due:
+                self.deferred.append(source)
+            return due
+
+    def record(self, source: str, fingerprint: str, now: datetime | None = None) -> bool:
+        now = now or datetime.now(timezone.utc)
+        with self.lock:
+            entry = self._load().setdefault(source, {"runs": 0, "changes": 0, "changeRate": 1.0})
+            changed = entry.get("fingerprint") != fingerprint
+            if changed:
+                interval = self.base_interval
+            else:
+                previous = timedelta(seconds=entry.get("intervalSeconds", self.base_interval.total_seconds()))
+                interval = min(previous * 2, self.max_interval(source))
+            entry["runs"] += 1
+            entry["changes"] += int(changed)
+            entry["changeRate"] = (1 - self.alpha) * entry["changeRate"] + self.alpha * float(changed)
+            entry["fingerprint"] = fingerprint
+            entry["intervalSeconds"] = interval.total_seconds()
+            entry["lastFetched"] = now.isoformat()
+            entry["nextDue"] = (now + interval).isoformat()
+            return changed
+
+    def save(self) -> None:
+        with self.lock:
+            if self.data is not None:
+                self._write()
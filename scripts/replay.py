@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Record/replay support for offline, reproducible pipeline runs.
+
+update_data.py --record ARCHIVE saves every response fetch_html sees into a
+gzipped JSON-lines bundle. --replay ARCHIVE starts ReplayServer on
+localhost and sends all fetches to it instead of the live sites. The
+server can also run on its own:
+
+    python scripts/replay.py ARCHIVE --port 8765 --latency search.yahoo.co.jp=400 --error-rate qlia.shop=0.1
+"""
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+
+class ResponseArchive:
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.records: dict[str, dict] = {}
+
+    def add(self, url: str, status: int, body: str, content_type: str | None = None) -> None:
+        with self.lock:
+            self.records[url] = {
+                "url": url,
+                "status": status,
+                "contentType": content_type or "text/html; charset=utf-8",
+                "body": body,
+                "recordedAt": time.time(),
+            }
+
+    def save(self) -> None:
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with gzip.open(self.path, "wt", encoding="utf-8") as handle:
+                for record in self.records.values():
+                    handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    @classmethod
+    def load(cls, path: Path) -> "ResponseArchive":
+        archive = cls(path)
+        with gzip.open(path, "rt", encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    record = json.loads(line)
+                    archive.records[record["url"]] = record
+        return archive
+
+
+def parse_host_values(items: list[str] | None, cast=float) -> dict:
+    values = {}
+    for item in items or []:
+        host, _, value = item.partition("=")
+        if not value:
+            values["*"] = cast(host)
+        else:
+            values[host] = cast(value)
+    return values
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Serves archived responses at /<original url>.
+
+    latency_ms and error_rate map a host (or "*" for every host) to the
+    added delay and to the share of requests answered with error_status.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        archive: ResponseArchive,
+        port: int = 0,
+        latency_ms: dict | None = None,
+        error_rate: dict | None = None,
+        error_status: int = 503,
+        seed: int = 0,
+    ):
+        super().__init__(("127.0.0.1", port), ReplayHandler)
+        self.archive = archive
+        self.latency_ms = latency_ms or {}
+        self.error_rate = error_rate or {}
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def host_value(self, table: dict, host: str) -> float:
+        return table.get(host, table.get("*", 0.0))
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    server: ReplayServer
+
+    def do_GET(self):
+        url = self.path[1:]
+        host = (urlparse(url).hostname or "").lower()
+        host = host[4:] if host.startswith("www.") else host
+
+        latency = self.server.host_value(self.server.latency_ms, host)
+        if latency:
+            time.sleep(latency / 1000)
+
+        with self.server.random_lock:
+            fail = self.server.random.random() < self.server.host_value(self.server.error_rate, host)
+        record = self.server.archive.records.get(url)
+        if fail:
+            self._send(self.server.error_status, "text/plain", b"injected error")
+        elif record is None:
+            self._send(404, "text/plain", b"not in archive")
+        else:
+            self._send(record["status"], record["contentType"], record["body"].encode("utf-8"))
+
+    def _send(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archive", type=Path)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", action="append", help="HOST=MS or MS for every host")
+    parser.add_argument("--error-rate", action="append", help="HOST=RATE or RATE for every host")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = ReplayServer(
+        ResponseArchive.load(args.archive),
+        port=args.port,
+        latency_ms=parse_host_values(args.latency),
+        error_rate=parse_host_values(args.error_rate),
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+    print(f"serving {len(server.archive.records)} responses at {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
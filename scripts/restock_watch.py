@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Poll a few tracked product pages and log stock changes as they happen.
+
+Products are given by their build_id IDs and resolved to detail URLs
+through the crawl state, which also knows sold-out Bonbon Drop items that
+products.json leaves out. Each poll is a conditional GET; a page whose
+body did not change is not looked at again, and a changed one is only
+scanned for JSON-LD offers.availability and SOLD_OUT_PATTERN.
+
+    python scripts/restock_watch.py sanrio_1a2b3c4d5e bonbondrop_0f9e8d7c6b
+    python scripts/restock_watch.py --sold-out --interval 20 --duration 280
+
+Changes are appended to data/restock_events.json (newest first).
+"""
+import argparse
+import re
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import update_data
+from crawl_state import content_fingerprint
+from merge_store import load_previous
+
+AVAILABILITY_PATTERN = re.compile(r'"availability"\s*:\s*"([^"]*)"')
+MAX_EVENTS = 200
+
+
+def read_in_stock(html: str) -> bool:
+    match = AVAILABILITY_PATTERN.search(html)
+    in_stock = update_data.normalize_in_stock(match.group(1) if match else None)
+    return in_stock and not update_data.is_sold_out(html)
+
+
+class RestockWatcher:
+    def __init__(self, targets: dict[str, dict], events_path: Path, max_events: int = MAX_EVENTS):
+        self.targets = targets
+        self.events_path = events_path
+        self.max_events = max_events
+        self.fingerprints: dict[str, str] = {}
+        self.events = load_previous(events_path)
+
+    def check(self, product_id: str) -> dict | None:
+        target = self.targets[product_id]
+        html = update_data.fetch_html(target["url"])
+        fingerprint = content_fingerprint(html)
+        if self.fingerprints.get(product_id) == fingerprint:
+            return None
+        self.fingerprints[product_id] = fingerprint
+        in_stock = read_in_stock(html)
+        previous = target.get("inStock")
+        target["inStock"] = in_stock
+        if previous is None or previous == in_stock:
+            return None
+        return {
+            "id": product_id,
+            "url": target["url"],
+            "name": target.get("name"),
+            "event": "restock" if in_stock else "sold_out",
+            "inStock": in_stock,
+            "detectedAt": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def poll(self) -> list[dict]:
+        events = [event for event in update_data.map_concurrent(self.check, list(self.targets)) if event]
+        if events:
+            self.events = (events + self.events)[:self.max_events]
+            update_data.write_json(self.events_path, self.events)
+        return events
+
+
+def resolve_targets(product_ids: list[str], sold_out: bool) -> dict[str, dict]:
+    entries = update_data.CRAWL_STATE.snapshot()
+    if sold_out:
+        product_ids = [*product_ids, *(key for key, entry in entries.items() if not entry["product"].get("in_stock", True))]
+    targets = {}
+    for product_id in dict.fromkeys(product_ids):
+        entry = entries.get(product_id)
+        if entry is None:
+            print(f"unknown product id (not in crawl state): {product_id}")
+            continue
+        targets[product_id] = {
+            "url": entry["url"],
+            "name": entry["product"].get("name"),
+            "inStock": entry["product"].get("in_stock"),
+        }
+    return targets
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("ids", nargs="*", help="product IDs as produced by build_id")
+    parser.add_argument("--ids-file", type=Path, help="file with one product ID per line")
+    parser.add_argument("--sold-out", action="store_true", help="also watch every product last seen sold out")
+    parser.add_argument("--interval", type=float, default=30.0, help="seconds between polls")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds (default: run until interrupted)")
+    parser.add_argument("--events", type=Path, default=update_data.OUTPUT_DIR / "restock_events.json")
+    parser.add_argument("--state-dir", type=Path, default=update_data.CACHE_DIR)
+    args = parser.parse_args()
+
+    if args.state_dir != update_data.CACHE_DIR:
+        update_data.configure_state(args.state_dir)
+    product_ids = list(args.ids)
+    if args.ids_file:
+        product_ids += [line.strip() for line in args.ids_file.read_text(encoding="utf-8").splitlines() if line.strip()]
+    targets = resolve_targets(product_ids, args.sold_out)
+    if not targets:
+        print("nothing to watch")
+        return 1
+
+    watcher = RestockWatcher(targets, args.events)
+    print(f"watching {len(targets)} products every {args.interval:g}s")
+    deadline = time.monotonic() + args.duration if args.duration else None
+    try:
+        while True:
+            started = time.monotonic()
+            for event in watcher.poll():
+                print(f"{event['detectedAt']} {event['event']}: {event['name']} {event['url']}")
+            if deadline and started + args.interval >= deadline:
+                break
+            time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        update_data.HTTP_CACHE.save()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
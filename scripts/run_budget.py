@@ -0,0 +1,73 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+RESERVE_SHARE = 0.1
+
+
+class RunBudget:
+    """Wall-clock deadline for one update run.
+
+    Work stops being scheduled once less than reserve is left before the
+    deadline, leaving that time for the requests in flight and for merging
+    and writing what was fetched. A short deadline scales the reserve down
+    to a tenth of the time it allows, so a 90s run still does some work. Stages that stopped early, at the deadline
+    or because a host's circuit was open, are remembered so their partial
+    results are not mistaken for complete ones.
+    """
+
+    def __init__(self, deadline: datetime | None = None, reserve: timedelta = timedelta(minutes=2)):
+        # Kept on the monotonic clock so a wall-clock step cannot move it.
+        self.deadline = None
+        self.reserve = reserve.total_seconds()
+        if deadline is not None:
+            allowed = (deadline - datetime.now(timezone.utc)).total_seconds()
+            self.deadline = time.monotonic() + allowed
+            self.reserve = min(self.reserve, max(0.0, allowed) * RESERVE_SHARE)
+        self.stopped: dict[str, int | None] = {}
+        self.reasons: dict[str, set[str]] = {}
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def remaining(self) -> float | None:
+        """Seconds left until the deadline, None without one."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def cancel(self) -> None:
+        """Stop scheduling work now, deadline or not (the run was told to stop)."""
+        self.cancelled = True
+
+    def exhausted(self) -> bool:
+        if self.cancelled:
+            return True
+        remaining = self.remaining()
+        return remaining is not None and remaining <= self.reserve
+
+    def cap_timeout(self, timeout: float) -> float:
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return max(1.0, min(timeout, remaining))
+
+    def stop(self, stage: str | None, skipped: int | None = None, reason: str | None = None) -> None:
+        """Record that stage left items unrun, with their number if known."""
+        reason = reason or ("cancelled" if self.cancelled else "deadline")
+        with self.lock:
+            stage = stage or "unstaged"
+            previous = self.stopped.get(stage, 0)
+            self.stopped[stage] = None if skipped is None or previous is None else previous + skipped
+            self.reasons.setdefault(stage, set()).add(reason)
+
+    def truncated(self, stage: str) -> bool:
+        with self.lock:
+            return stage in self.stopped
+
+    def summary(self) -> list[str]:
+        with self.lock:
+            return [
+                f"{stage}: stopped early ({', '.join(sorted(self.reasons[stage]))})"
+                + (f", {skipped} items not run" if skipped is not None else "")
+                for stage, skipped in sorted(self.stopped.items())
+            ]
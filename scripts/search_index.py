@@ -0,0 +1,69 @@
+"""Inverted index over an SNS feed export, written next to it.
+
+sns_<feed>.index.json:
+
+    {
+      "version": 1,
+      "feed": "sns_bonbon.json",
+      "sha256": "<sha256 of the feed file the offsets refer to>",
+      "count": <number of posts>,
+      "ngram": 2,
+      "stores": {"<store name>": [offset, ...]},
+      "locations": {"<prefecture>": [offset, ...]},
+      "ngrams": {"<n-gram>": [delta, ...]}
+    }
+
+Offsets are positions in the feed's JSON array. n-gram postings are delta
+encoded (first offset, then gaps) and built from the normalized content, so
+a client normalizes its query the same way (NFKC, lower case, URLs and
+punctuation removed), intersects the postings of every query n-gram and
+confirms the hits against the posts themselves.
+"""
+from collections.abc import Callable
+
+from near_dup import normalize_text
+
+SEARCH_INDEX_VERSION = 1
+NGRAM_SIZE = 2
+
+
+def _ngrams(text: str) -> set[str]:
+    if len(text) < NGRAM_SIZE:
+        return {text} if text else set()
+    return {text[index:index + NGRAM_SIZE] for index in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def _delta_encode(offsets: list[int]) -> list[int]:
+    return [offset - previous for previous, offset in zip([0, *offsets], offsets)]
+
+
+def build_search_index(
+    posts: list[dict],
+    feed_entry: dict,
+    infer_store: Callable[[str], str | None],
+    infer_location: Callable[[str], str | None],
+) -> dict:
+    stores: dict[str, list[int]] = {}
+    locations: dict[str, list[int]] = {}
+    ngrams: dict[str, list[int]] = {}
+    for offset, post in enumerate(posts):
+        content = post.get("content") or ""
+        store = post.get("storeName") or infer_store(content)
+        if store:
+            stores.setdefault(store, []).append(offset)
+        location = post.get("location") or infer_location(content)
+        if location:
+            locations.setdefault(location, []).append(offset)
+        for gram in _ngrams(normalize_text(content)):
+            ngrams.setdefault(gram, []).append(offset)
+
+    return {
+        "version": SEARCH_INDEX_VERSION,
+        "feed": feed_entry["path"],
+        "sha256": feed_entry["sha256"],
+        "count": len(posts),
+        "ngram": NGRAM_SIZE,
+        "stores": dict(sorted(stores.items())),
+        "locations": dict(sorted(locations.items())),
+        "ngrams": {gram: _delta_encode(offsets) for gram, offsets in sorted(ngrams.items())},
+    }
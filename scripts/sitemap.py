@@ -0,0 +1,107 @@
+import xml.etree.ElementTree as ET
+from collections.abc import Callable, Iterator
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import NamedTuple
+from urllib.parse import urljoin
+
+MAX_SITEMAPS = 50
+
+
+class SitemapEntry(NamedTuple):
+    url: str
+    lastmod: datetime | None
+    is_sitemap: bool
+
+
+def parse_lastmod(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            parsed = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def iter_sitemap_entries(text: str) -> Iterator[SitemapEntry]:
+    """URLs from a sitemap, sitemap index, RSS or Atom document."""
+    parser = ET.XMLPullParser(events=("end",))
+    parser.feed(text)
+    parser.close()
+    yield from _drain(parser)
+
+
+def _drain(parser: ET.XMLPullParser) -> Iterator[SitemapEntry]:
+    for _, element in parser.read_events():
+        tag = _local(element.tag)
+        if tag not in ("url", "sitemap", "item", "entry"):
+            continue
+        fields = {_local(child.tag): child for child in element}
+        if tag == "entry":
+            link = fields.get("link")
+            url = link.get("href") if link is not None else None
+            lastmod = fields.get("updated")
+        else:
+            link = fields.get("loc" if tag in ("url", "sitemap") else "link")
+            url = link.text if link is not None else None
+            lastmod = fields.get("lastmod" if tag != "item" else "pubDate")
+        if url and url.strip():
+            yield SitemapEntry(
+                url.strip(),
+                parse_lastmod(lastmod.text if lastmod is not None else None),
+                tag == "sitemap",
+            )
+        element.clear()
+
+
+def sitemap_urls_from_robots(robots_txt: str, site_url: str) -> list[str]:
+    urls = []
+    for line in robots_txt.splitlines():
+        key, _, value = line.partition(":")
+        if key.strip().lower() == "sitemap" and value.strip():
+            urls.append(urljoin(site_url, value.strip()))
+    return urls
+
+
+def iter_sitemap_products(
+    site_url: str,
+    fetch: Callable[[str], str | None],
+    is_product: Callable[[str], bool],
+    max_sitemaps: int = MAX_SITEMAPS,
+) -> Iterator[SitemapEntry]:
+    """Product URLs listed in a site's sitemaps, following sitemap indexes.
+
+    Sitemaps are taken from robots.txt, or /sitemap.xml when it names
+    none. fetch returns None for pages that could not be fetched, and
+    documents that are not well-formed XML are skipped.
+    """
+    robots = fetch(urljoin(site_url, "/robots.txt"))
+    queue = sitemap_urls_from_robots(robots or "", site_url) or [urljoin(site_url, "/sitemap.xml")]
+    visited = set()
+    seen_urls = set()
+    while queue and len(visited) < max_sitemaps:
+        sitemap_url = queue.pop(0)
+        if sitemap_url in visited or sitemap_url.endswith(".gz"):
+            continue
+        visited.add(sitemap_url)
+        text = fetch(sitemap_url)
+        if not text:
+            continue
+        try:
+            for entry in iter_sitemap_entries(text):
+                if entry.is_sitemap:
+                    queue.append(urljoin(sitemap_url, entry.url))
+                elif entry.url not in seen_urls and is_product(entry.url):
+                    seen_urls.add(entry.url)
+                    yield entry
+        except ET.ParseError:
+            continue
@@ -0,0 +1,50 @@
+import pytest
+import requests
+
+import update_data
+from host_health import HostHealth
+
+
+class FakeSession:
+    def __init__(self, status: int):
+        self.status = status
+        self.calls = 0
+
+    def get(self, url, headers=None, timeout=None):
+        self.calls += 1
+        response = requests.Response()
+        response.status_code = self.status
+        response.url = url
+        response._content = b""
+        return response
+
+
+@pytest.fixture
+def fetch(monkeypatch, tmp_path):
+    update_data.configure_state(tmp_path)
+    monkeypatch.setattr(update_data, "HOST_HEALTH", HostHealth(failure_threshold=3, cooldown=60.0, backoff_base=0.0))
+    monkeypatch.setattr(update_data, "DEFAULT_HOST_LIMIT", (1, 1000.0))
+    yield
+    update_data.configure_state(update_data.CACHE_DIR)
+
+
+@pytest.mark.parametrize("status, attempts", [(403, 1), (429, 1 + update_data.MAX_RETRIES)])
+def test_refusals_open_the_circuit(fetch, monkeypatch, status, attempts):
+    session = FakeSession(status)
+    monkeypatch.setattr(update_data, "SESSION", session)
+    url = f"https://refusing-{status}.example/item"
+    for _ in range(3):
+        with pytest.raises(update_data.FetchError):
+            update_data.fetch_html(url)
+    assert update_data.HOST_HEALTH.is_open(f"refusing-{status}.example")
+    with pytest.raises(update_data.FetchSkipped):
+        update_data.fetch_html(url)
+    assert session.calls == 3 * attempts
+
+
+def test_404s_leave_the_circuit_closed(fetch, monkeypatch):
+    monkeypatch.setattr(update_data, "SESSION", FakeSession(404))
+    for _ in range(5):
+        with pytest.raises(update_data.FetchError):
+            update_data.fetch_html("https://missing.example/item")
+    assert not update_data.HOST_HEALTH.is_open("missing.example")
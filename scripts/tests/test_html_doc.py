@@ -0,0 +1,46 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from html_doc import LexborHTMLParser, parse_html
+
+FIXTURE_DIR = Path(__file__).resolve().parents[1] / "bench_fixtures"
+BACKENDS = ["html.parser", "lxml"] + (["selectolax"] if LexborHTMLParser is not None else [])
+
+RAFFLE_HTML = (
+    "<html><head><title> 抽選のお知らせ </title><style>p{color:red}</style></head><body>"
+    '<script type="application/ld+json">{"name":"抽選 2026/03/01"}</script>'
+    "<p>抽選販売 受付 3月10日まで</p> <div> </div><p>詳細<!-- note --></p>"
+    "</body></html>"
+)
+
+
+def extracted(html: str, backend: str) -> dict:
+    doc = parse_html(html, backend)
+    return {
+        "text": doc.text(),
+        "title": doc.title(),
+        "jsonld": doc.jsonld_blocks(),
+        "og:image": doc.meta("og:image"),
+        "description": doc.meta("description"),
+    }
+
+
+def sample_pages() -> list[str]:
+    pages = [RAFFLE_HTML, json.loads((FIXTURE_DIR / "oembed.json").read_text(encoding="utf-8"))["html"]]
+    pages += [path.read_text(encoding="utf-8") for path in sorted(FIXTURE_DIR.glob("*.html"))]
+    return pages
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("html", sample_pages(), ids=lambda html: str(len(html)))
+def test_backends_extract_the_same(html, backend):
+    assert extracted(html, backend) == extracted(html, "html.parser")
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_text_skips_script_and_style(backend):
+    doc = parse_html(RAFFLE_HTML, backend)
+    assert doc.text() == "抽選のお知らせ 抽選販売 受付 3月10日まで 詳細"
+    assert doc.jsonld_blocks() == ['{"name":"抽選 2026/03/01"}']
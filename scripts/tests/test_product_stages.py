@@ -0,0 +1,156 @@
+import pytest
+import requests
+
+import update_data
+from host_health import HostHealth
+from run_budget import RunBudget
+
+STAGE = "products.fake"
+
+
+class ShopSession:
+    """Serves a product page for every URL except those in failing."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.requested = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requested.append(url)
+        if url in self.failing:
+            raise requests.ConnectionError(f"refused: {url}")
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = f"<html><head><title>item {url[-2:]}</title></head><body>1,200円</body></html>".encode()
+        response.encoding = "utf-8"
+        return response
+
+
+def links(count: int) -> list[str]:
+    return [f"https://shop.example/item/{index:02d}" for index in range(count)]
+
+
+def make_products(urls: list[str], price: float = 1000.0) -> list[dict]:
+    source = update_data.PRODUCT_SOURCES["fake"]
+    return [
+        update_data.make_product(
+            source.prefix,
+            source.category,
+            source.store_id,
+            source.store_name,
+            {"name": f"old {url[-2:]}", "description": "", "image": "", "price": price, "in_stock": True, "url": url},
+        )
+        for url in urls
+    ]
+
+
+@pytest.fixture
+def shop(monkeypatch, tmp_path):
+    source = update_data.ProductSource(
+        "fake", "fake", "fake_store", "Fake Store", lambda: links(20), lambda product: True
+    )
+    monkeypatch.setitem(update_data.PRODUCT_SOURCES, "fake", source)
+    monkeypatch.setattr(update_data, "HOST_HEALTH", HostHealth(failure_threshold=3, cooldown=60.0))
+    monkeypatch.setattr(update_data, "BUDGET", RunBudget())
+    monkeypatch.setattr(update_data, "DEFAULT_HOST_LIMIT", (1, 1000.0))
+    update_data.configure_state(tmp_path)
+    yield tmp_path
+    update_data.configure_state(update_data.CACHE_DIR)
+
+
+def published_prices(products: list[dict]) -> dict[str, float]:
+    return {product["prices"][0]["url"]: product["prices"][0]["price"] for product in products}
+
+
+def test_open_circuit_carries_previous_products_forward(shop, monkeypatch):
+    session = ShopSession(failing=links(20))
+    monkeypatch.setattr(update_data, "SESSION", session)
+    previous = make_products(links(20))
+
+    products = update_data.run_stage(STAGE, update_data.fetch_products_when_due, "fake", previous)
+
+    # Three failures open the circuit; the other pages are never requested.
+    assert len(session.requested) == 3
+    assert published_prices(products) == published_prices(previous)
+    assert update_data.BUDGET.truncated(STAGE)
+    assert STAGE not in update_data.REFRESH_SCHEDULER._load()
+    assert update_data.CHECKPOINT.items(STAGE) == {}
+    assert not update_data.CHECKPOINT.result(STAGE)[0]
+
+
+def test_cancelled_run_stops_fetching(shop, monkeypatch):
+    session = ShopSession()
+    original_get = session.get
+
+    def get_then_cancel(url, headers=None, timeout=None):
+        if len(session.requested) == 2:
+            update_data.BUDGET.cancel()
+        return original_get(url, headers, timeout)
+
+    monkeypatch.setattr(session, "get", get_then_cancel)
+    monkeypatch.setattr(update_data, "SESSION", session)
+    previous = make_products(links(20))
+
+    products = update_data.run_stage(STAGE, update_data.fetch_products_when_due, "fake", previous)
+
+    # Requests already holding a host slot finish; nothing new is sent.
+    assert len(session.requested) <= 3
+    assert set(published_prices(products)) == set(links(20))
+    assert update_data.BUDGET.summary() == [f"{STAGE}: stopped early (cancelled)"]
+
+
+def test_shop_not_due_carries_previous_products_forward(shop, monkeypatch):
+    session = ShopSession()
+    monkeypatch.setattr(update_data, "SESSION", session)
+    update_data.REFRESH_SCHEDULER.record(STAGE, "unchanged")
+    previous = make_products(links(5))
+
+    products = update_data.run_stage(STAGE, update_data.fetch_products_when_due, "fake", previous)
+
+    # In-stock products have no sold-out page to recheck: nothing is fetched.
+    assert session.requested == []
+    assert published_prices(products) == published_prices(previous)
+    assert not update_data.BUDGET.truncated(STAGE)
+    assert update_data.REFRESH_SCHEDULER.deferred == [STAGE]
+
+
+def test_interrupted_stage_resumes_from_the_checkpoint(shop, monkeypatch):
+    first = ShopSession()
+    original_get = first.get
+
+    def get_then_cancel(url, headers=None, timeout=None):
+        if len(first.requested) == 5:
+            update_data.BUDGET.cancel()
+        return original_get(url, headers, timeout)
+
+    monkeypatch.setattr(first, "get", get_then_cancel)
+    monkeypatch.setattr(update_data, "SESSION", first)
+    previous = make_products(links(20))
+    update_data.run_stage(STAGE, update_data.fetch_products_when_due, "fake", previous)
+    # What the SIGTERM handler leaves behind: the pages handled so far.
+    update_data.CHECKPOINT.flush()
+    fetched = set(first.requested)
+    assert 0 < len(fetched) < 20
+
+    # The next run starts from the files on disk, as a new process would.
+    update_data.configure_state(shop)
+    monkeypatch.setattr(update_data, "BUDGET", RunBudget())
+    second = ShopSession()
+    monkeypatch.setattr(update_data, "SESSION", second)
+    assert set(update_data.CHECKPOINT.items(STAGE)) == fetched
+
+    products = update_data.run_stage(STAGE, update_data.fetch_products_when_due, "fake", previous)
+
+    assert sorted(second.requested) == sorted(set(links(20)) - fetched)
+    assert published_prices(products) == {url: 1200.0 for url in links(20)}
+    assert STAGE in update_data.REFRESH_SCHEDULER._load()
+    update_data.CHECKPOINT.flush()
+
+    # Once complete, a run that dies before publishing reuses the stage whole.
+    update_data.configure_state(shop)
+    third = ShopSession()
+    monkeypatch.setattr(update_data, "SESSION", third)
+    resumed = update_data.run_stage(STAGE, update_data.fetch_products_when_due, "fake", previous)
+    assert third.requested == []
+    assert published_prices(resumed) == published_prices(products)
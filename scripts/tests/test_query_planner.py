@@ -0,0 +1,94 @@
+import pytest
+
+from query_planner import QueryPlanner
+
+CITIES = {"大阪": "大阪府", "梅田": "大阪府", "神戸": "兵庫県"}
+KEYWORDS = ["シール 大阪", "シール 梅田", "シール 神戸"]
+MERGED = "シール (大阪 OR 梅田)"
+
+
+def run(planner, hits, not_run=(), truncated=False):
+    """Plan one run and record it, with hits mapping queries to their post ids."""
+    plan = planner.plan("feed", KEYWORDS, CITIES)
+    skipped = [query for query in plan if query.query in not_run]
+    results = [(query, hits.get(query.query, [])) for query in plan if query.query not in not_run]
+    return plan, planner.record("feed", results, skipped, truncated=truncated)
+
+
+@pytest.fixture
+def planner(tmp_path):
+    return QueryPlanner(tmp_path / "query_planner.json", probe_every=3)
+
+
+def queries(plan):
+    return sorted(query.query for query in plan)
+
+
+def test_probe_run_searches_merged_groups_and_their_cities(planner):
+    plan, report = run(planner, {MERGED: ["a"], "シール 大阪": ["a"], "シール 梅田": ["b"]})
+    assert report["probe"]
+    assert queries(plan) == sorted([MERGED, *KEYWORDS])
+    assert report["compare"] == {MERGED: ["シール 大阪", "シール 梅田"]}
+
+
+def test_probe_cadence_skips_truncated_runs(planner):
+    probes = []
+    for _ in range(4):
+        _, report = run(planner, {MERGED: ["a"], "シール 大阪": ["a"]})
+        probes.append(report["probe"])
+    assert probes == [True, False, False, True]
+
+    # Stopped runs do not count, so the next probe is not pushed out by them.
+    run(planner, {}, truncated=True)
+    assert planner._feed("feed")["runs"] == 4
+    assert not planner.is_probe_run("feed")
+
+
+def test_low_recall_group_is_split_until_a_probe_shows_merging_is_safe(planner):
+    _, report = run(planner, {MERGED: ["a"], "シール 大阪": ["a", "b"], "シール 梅田": ["c"]})
+    assert report["groupRecall"] == {MERGED: round(1 / 3, 3)}
+    assert planner._feed("feed")["split"] == [MERGED]
+
+    plan, _ = run(planner, {"シール 大阪": ["a"]})
+    assert queries(plan) == sorted(KEYWORDS)
+    run(planner, {"シール 大阪": ["a"]})
+
+    _, report = run(planner, {MERGED: ["a", "b"], "シール 大阪": ["a"], "シール 梅田": ["b"]})
+    assert report["probe"] and report["groupRecall"] == {MERGED: 1.0}
+    assert planner._feed("feed")["split"] == []
+    plan, _ = run(planner, {MERGED: ["a"]})
+    # 神戸 found nothing on any run, so it is skipped until the next probe.
+    assert queries(plan) == [MERGED]
+    assert planner._feed("feed")["lastPlan"]["skipped"] == ["シール 神戸"]
+
+
+def test_merged_query_misses_are_estimated_from_its_last_recall(tmp_path):
+    planner = QueryPlanner(tmp_path / "query_planner.json", probe_every=3, min_merge_recall=0.5)
+    _, report = run(planner, {MERGED: ["a"], "シール 大阪": ["a"], "シール 梅田": ["b"]})
+    assert report["groupRecall"] == {MERGED: 0.5}
+    # The probe itself searched every city, so nothing is estimated missing.
+    assert report["estimatedMissed"] == 0
+
+    _, report = run(planner, {MERGED: ["a", "b"], "シール 神戸": ["c"]})
+    # Two merged hits at recall 0.5 stand for two more posts not seen.
+    assert report["estimatedMissed"] == 2.0
+    assert report["estimatedRecall"] == round(3 / 5, 3)
+
+
+def test_not_run_queries_are_left_out_of_the_stats(planner):
+    run(planner, {MERGED: ["a"], "シール 大阪": ["a"], "シール 梅田": ["a"], "シール 神戸": ["c"]})
+    stats = planner._feed("feed")["queries"]
+    before = {query: dict(entry) for query, entry in stats.items()}
+
+    _, report = run(planner, {MERGED: ["a", "b"]}, not_run={"シール 神戸"})
+
+    assert report["notRun"] == 1 and report["plannedQueries"] == 2
+    assert {"query": "シール 神戸", "notRun": True} in report["queries"]
+    assert stats["シール 神戸"] == before["シール 神戸"]
+    # The merged query ran, but without its neighbour its exclusive share
+    # would be overstated, so only its yield moves.
+    assert stats[MERGED]["runs"] == 2
+    assert stats[MERGED]["exclusive"] == before[MERGED]["exclusive"]
+    assert stats[MERGED]["yield"] != before[MERGED]["yield"]
+    assert "exclusive" not in report["queries"][0]
+    assert report["estimatedRecall"] == 1.0
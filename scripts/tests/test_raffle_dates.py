@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+import update_data
+from html_doc import parse_html
+
+NOW = datetime(2026, 2, 21, tzinfo=timezone(timedelta(hours=9)))
+KEYWORD = update_data.RAFFLE_KEYWORD
+RADIUS = update_data.RAFFLE_DATE_WINDOW
+FIXTURE_DIR = Path(__file__).resolve().parents[1] / "bench_fixtures"
+
+
+def windowed(text: str) -> list[datetime]:
+    return update_data.extract_date_candidates(text, NOW, anchor=KEYWORD)
+
+
+def full(text: str) -> list[datetime]:
+    return update_data.extract_date_candidates(text, NOW)
+
+
+@pytest.mark.parametrize("padding", range(RADIUS - 8, RADIUS + 2))
+def test_date_crossing_window_end_is_read_whole(padding):
+    text = KEYWORD + "あ" * padding + "3月15日"
+    expected = full(text)
+    assert windowed(text) == (expected if padding < RADIUS else [])
+
+
+@pytest.mark.parametrize("padding", range(RADIUS - 12, RADIUS + 2))
+def test_date_crossing_window_start_keeps_its_year(padding):
+    text = "2027年3月15日" + "あ" * padding + KEYWORD
+    expected = full(text)
+    assert windowed(text) == (expected if padding < RADIUS else [])
+
+
+def test_dates_between_overlapping_windows_are_read_once():
+    text = KEYWORD + "あ" * 140 + "2026年3月15日" + "あ" * 140 + KEYWORD
+    assert windowed(text) == full(text) == [datetime(2026, 3, 15, tzinfo=NOW.tzinfo)]
+
+
+def test_windowed_dates_are_a_subset_of_full_text_dates():
+    text = parse_html((FIXTURE_DIR / "raffle_page.html").read_text(encoding="utf-8")).text()
+    assert set(windowed(text)) <= set(full(text))
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from refresh_scheduler import RefreshScheduler
+
+START = datetime(2026, 2, 21, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return RefreshScheduler(tmp_path / "refresh.json", max_intervals={"products.": timedelta(hours=3)})
+
+
+def intervals(scheduler, source, fingerprints):
+    """Record fingerprints an interval apart; returns each resulting interval in hours."""
+    now = START
+    result = []
+    for fingerprint in fingerprints:
+        scheduler.record(source, fingerprint, now)
+        hours = scheduler._load()[source]["intervalSeconds"] / 3600
+        result.append(hours)
+        now += timedelta(hours=hours)
+    return result
+
+
+def test_unchanged_results_double_the_interval_up_to_the_cap(scheduler):
+    assert intervals(scheduler, "raffle", ["a"] * 5) == [1, 2, 4, 6, 6]
+    assert intervals(scheduler, "products.shop", ["a"] * 4) == [1, 2, 3, 3]
+
+
+def test_changed_result_resets_the_interval(scheduler):
+    assert intervals(scheduler, "raffle", ["a", "a", "a", "b", "b"]) == [1, 2, 4, 1, 2]
+
+
+def test_is_due_within_tolerance_of_next_due(scheduler):
+    scheduler.record("raffle", "a", START)
+    scheduler.record("raffle", "a", START)
+    next_due = START + timedelta(hours=2)
+    assert not scheduler.is_due("raffle", next_due - timedelta(minutes=11))
+    assert scheduler.deferred == ["raffle"]
+    assert scheduler.is_due("raffle", next_due - timedelta(minutes=9))
+    assert scheduler.is_due("unknown", START)
+
+
+def test_force_makes_everything_due(scheduler):
+    scheduler.record("raffle", "a", START)
+    scheduler.force = True
+    assert scheduler.is_due("raffle", START)
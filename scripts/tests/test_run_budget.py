@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from run_budget import RunBudget
+
+
+def test_short_deadline_scales_the_reserve_down():
+    budget = RunBudget(datetime.now(timezone.utc) + timedelta(seconds=90))
+    assert budget.reserve == pytest.approx(9.0, abs=0.1)
+    assert not budget.exhausted()
+
+
+def test_long_deadline_keeps_the_full_reserve():
+    budget = RunBudget(datetime.now(timezone.utc) + timedelta(minutes=40))
+    assert budget.reserve == 120.0
+    assert not budget.exhausted()
+
+
+def test_past_deadline_is_exhausted():
+    budget = RunBudget(datetime.now(timezone.utc) - timedelta(seconds=5))
+    assert budget.exhausted()
@@ -0,0 +1,80 @@
+import pytest
+
+import update_data
+from run_budget import RunBudget
+
+KEYWORDS = ["シール 大阪", "シール 梅田", "シール 神戸"]
+MERGED = "シール (大阪 OR 梅田)"
+RESULTS = {MERGED: ["a"], "シール 大阪": ["a", "b"], "シール 梅田": ["c"], "シール 神戸": ["d"]}
+
+
+@pytest.fixture
+def search(monkeypatch, tmp_path):
+    update_data.configure_state(tmp_path)
+    monkeypatch.setattr(update_data, "BUDGET", RunBudget())
+    searched = []
+
+    def fake_search(label, query):
+        searched.append(query)
+        return [
+            {"postUrl": f"https://x.com/u/status/{post}", "postedAt": "2026-02-21T00:00:00+00:00"}
+            for post in RESULTS[query]
+        ]
+
+    monkeypatch.setattr(update_data, "search_yahoo_realtime", fake_search)
+    yield searched
+    update_data.configure_state(update_data.CACHE_DIR)
+
+
+def defer_all():
+    for query in [MERGED, *KEYWORDS]:
+        update_data.REFRESH_SCHEDULER.record(f"x_search.feed:{query}", "unchanged")
+
+
+def test_probe_run_ignores_the_scheduler(search):
+    defer_all()
+    update_data.fetch_x_posts_for_keywords(KEYWORDS, "feed")
+    assert sorted(search) == sorted([MERGED, *KEYWORDS])
+    report = update_data.QUERY_PLANNER.reports[-1]
+    assert report["probe"] and report["notRun"] == 0
+    assert report["groupRecall"] == {MERGED: round(1 / 3, 3)}
+
+
+def test_deferred_queries_are_reported_as_not_run(search):
+    update_data.fetch_x_posts_for_keywords(KEYWORDS, "feed")
+    exclusive = {query: entry["exclusive"] for query, entry in update_data.QUERY_PLANNER._feed("feed")["queries"].items()}
+    defer_all()
+    search.clear()
+
+    update_data.fetch_x_posts_for_keywords(KEYWORDS, "feed")
+
+    assert search == []
+    report = update_data.QUERY_PLANNER.reports[-1]
+    assert not report["probe"] and not report["truncated"]
+    # The probe split the lossy group, so its cities were planned one by one.
+    assert report["notRun"] == 3
+    feed_state = update_data.QUERY_PLANNER._feed("feed")
+    assert feed_state["runs"] == 2
+    assert {query: entry["exclusive"] for query, entry in feed_state["queries"].items()} == exclusive
+
+
+def test_unfinished_enrichment_is_retried_before_a_full_miss(monkeypatch, tmp_path):
+    update_data.configure_state(tmp_path)
+    monkeypatch.setattr(update_data, "BUDGET", RunBudget())
+    monkeypatch.setattr(update_data, "fetch_x_oembed_text", lambda url: None)
+
+    def skipped(url):
+        raise update_data.FetchSkipped(f"circuit open for {url}")
+
+    monkeypatch.setattr(update_data, "fetch_x_og_text", skipped)
+    posts = [{"type": "twitter", "postUrl": f"https://x.com/u/status/{n}", "content": ""} for n in range(3)]
+    try:
+        update_data.enrich_x_post_content(posts, max_lookups=2)
+        cache = update_data.ENRICHMENT_CACHE
+        assert cache.lookup("0") == (True, None)
+        assert cache.lookup("2") == (False, None)
+        for entry in cache.data.values():
+            entry[1] -= update_data.X_ENRICH_PARTIAL_MISS_TTL + 1
+        assert cache.lookup("0") == (False, None)
+    finally:
+        update_data.configure_state(update_data.CACHE_DIR)
@@ -1,14 +1,46 @@
 #!/usr/bin/env python3
+import argparse
+import contextvars
 import hashlib
 import json
+import multiprocessing
+import os
 import re
+import signal
+import sys
+import threading
 import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Sized
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import NamedTuple
 from urllib.parse import quote, urljoin, urlparse, parse_qs, unquote
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from checkpoint import RunCheckpoint
+from crawl_state import CrawlState, content_fingerprint
+from enrichment_cache import EnrichmentCache
+from html_doc import Document, parse_html
+from history_store import HistoryStore
+from host_health import HostHealth, parse_retry_after
+from http_cache import HttpCache
+from link_scan import iter_hrefs, iter_token_urls, scan_x_statuses
+from merge_store import load_previous, merge_posts, merge_products
+from metrics import RunMetrics, current_stage
+from near_dup import collapse_near_duplicates
+from outputs import serialize, write_manifest, write_output, write_shards
+from query_planner import PlannedQuery, QueryPlanner, format_report
+from raffle_cache import RaffleDateCache
+from records import PriceEntry, Product, SnsPost
+from refresh_scheduler import RefreshScheduler, result_fingerprint
+from replay import ReplayServer, ResponseArchive, parse_host_values
+from run_budget import RunBudget
+from search_index import build_search_index
+from sitemap import iter_sitemap_products
 
 HEADERS = {
     "User-Agent": (
@@ -18,6 +50,14 @@ HEADERS = {
     )
 }
 TIMEOUT_SECONDS = 20
+# Transient statuses worth another try; anything else fails immediately.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Not retried, but a sign the host is refusing us: counts towards its circuit.
+BLOCKED_STATUSES = {403}
+MAX_RETRIES = 2
+# With --deadline, new work stops this long before it so in-flight requests
+# and the merge and write stages still fit.
+DEADLINE_RESERVE = timedelta(minutes=2)
 
 BONBON_BASE_KEYWORDS = [
     "\u30dc\u30f3\u30dc\u30f3\u30c9\u30ed\u30c3\u30d7 \u5165\u8377",
@@ -83,35 +123,295 @@ CITY_TO_PREF = {
 }
 
 X_REQUEST_DELAY_SECONDS = 0.6
+X_ENRICH_DELAY_SECONDS = 0.3
 X_MAX_URLS_PER_KEYWORD = 100
+X_ENRICH_MAX_LOOKUPS = 30
+# oEmbed missed but the og:description fallback never went out (the run or
+# the host circuit stopped it): retry sooner than a full miss, but not on the
+# very next run, so these posts do not take the lookup budget every time.
+X_ENRICH_PARTIAL_MISS_TTL = 3 * 3600
+X_STATUS_ID_PATTERN = re.compile(r"/status/(\d+)")
+X_PLACEHOLDER_SUFFIX = " \u306b\u95a2\u3059\u308b\u6295\u7a3f"
+
+# Per-host politeness: (max concurrent requests, requests per second).
+HOST_LIMITS = {
+    "shop.sanrio.co.jp": (4, 4.0),
+    "tamagotchi-official.com": (4, 4.0),
+    "qlia.shop": (3, 3.0),
+    "search.yahoo.co.jp": (2, 1 / X_REQUEST_DELAY_SECONDS),
+    "duckduckgo.com": (1, 1.0),
+    "publish.twitter.com": (3, 1 / X_ENRICH_DELAY_SECONDS),
+}
+DEFAULT_HOST_LIMIT = (2, 2.0)
+MAX_WORKERS = 8
 
 OUTPUT_DIR = Path(__file__).resolve().parents[1] / "data"
+# "day" or "location" to also write per-shard SNS files listed in
+# manifest.json; set by --shard-sns-by.
+SNS_SHARD_BY: str | None = None
+SNS_RETENTION = timedelta(days=7)
+CACHE_DIR = Path(__file__).resolve().parents[1] / ".cache"
+HTTP_CACHE_MAX_BYTES = 64 * 1024 * 1024
+CRAWL_MAX_AGE = timedelta(hours=24)
+HISTORY_POST_RETENTION = timedelta(days=90)
+HISTORY_OBSERVATION_RETENTION = timedelta(days=365)
+# Longest back-off per source prefix while a source's results stay the same.
+# A shop's sold-out product pages are refetched on every run, so a backed-off
+# listing crawl does not delay a restock.
+REFRESH_MAX_INTERVALS = {
+    "products.": timedelta(hours=3),
+    "x_search.": timedelta(hours=4),
+    "raffle": timedelta(hours=12),
+}
+
+# Listing pages read per shop when it has no usable sitemap (--listing-pages).
+LISTING_MAX_PAGES = 30
 
 SANRIO_LIST_URL = "https://shop.sanrio.co.jp/item?category_id=130"
 TAMAGOTCHI_LIST_URL = "https://tamagotchi-official.com/jp/item/"
 QLIA_CATEGORY_URL = "https://qlia.shop/?mode=cate&cbid=2943125&csid=16&sort=n"
 
+TAMAGOTCHI_ITEM_PATTERN = re.compile(r"/jp/item/\d{2}_\d+/?$")
+
 SOLD_OUT_PATTERN = re.compile(
     r"SOLD\s*OUT|SOLDOUT|売り切れ|在庫切れ",
     re.IGNORECASE,
 )
-DATE_WITH_YEAR = re.compile(
-    r"(20\d{2})\s*[./\-年]\s*(\d{1,2})\s*[./\-月]\s*(\d{1,2})\s*(?:日)?"
-)
-DATE_NO_YEAR = re.compile(
-    r"(\d{1,2})\s*[./\-月]\s*(\d{1,2})\s*(?:日)?"
+# One alternation for dated and undated matches: a date with a year
+# consumes its span, so its month/day is never re-read as a no-year date.
+DATE_PATTERN = re.compile(
+    r"(?:(20\d{2})\s*[./\-年]\s*)?(\d{1,2})\s*[./\-月]\s*(\d{1,2})\s*(?:日)?"
 )
+# Every character DATE_PATTERN can match besides digits and whitespace.
+DATE_JOINERS = "./-年月日"
+RAFFLE_KEYWORD = "抽選"
+RAFFLE_DATE_WINDOW = 150
 
 
 class FetchError(RuntimeError):
     pass
 
 
+class FetchSkipped(FetchError):
+    """No request was sent: the host's circuit is open or the run is out of time."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostLimiter:
+    def __init__(self, max_concurrent: int, rate: float):
+        self.semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.bucket = TokenBucket(rate)
+
+
+_host_limiters: dict[str, HostLimiter] = {}
+_host_limiters_lock = threading.Lock()
+
+
+def url_host(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def host_limiter(url: str) -> HostLimiter:
+    host = url_host(url)
+    with _host_limiters_lock:
+        limiter = _host_limiters.get(host)
+        if limiter is None:
+            max_concurrent, rate = HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)
+            limiter = HostLimiter(max_concurrent, rate)
+            _host_limiters[host] = limiter
+        return limiter
+
+
+def imap_concurrent(func, items: Iterable, max_workers: int = MAX_WORKERS) -> Iterator:
+    """Lazy map_concurrent: pulls items as workers free up and yields in input order.
+
+    At most 2 * max_workers items are in flight, so a generator upstream
+    is consumed at the pace of the stage downstream. Once the run budget is
+    exhausted no further items are pulled: the results end early, after
+    the ones already in flight.
+    """
+    context = contextvars.copy_context()
+
+    def run(item):
+        with METRICS.track_worker():
+            try:
+                return func(item)
+            except FetchError:
+                return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque()
+        for index, item in enumerate(items):
+            if BUDGET.exhausted():
+                BUDGET.stop(current_stage.get(), len(items) - index if isinstance(items, Sized) else None)
+                break
+            pending.append(pool.submit(context.copy().run, run, item))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def map_concurrent(func, items, max_workers: int = MAX_WORKERS) -> list:
+    items = list(items)
+    if not items:
+        return []
+    return list(imap_concurrent(func, items, min(max_workers, len(items))))
+
+
+def build_session() -> requests.Session:
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=MAX_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def configure_state(cache_dir: Path) -> None:
+    global HTTP_CACHE, CRAWL_STATE, ENRICHMENT_CACHE, QUERY_PLANNER, RAFFLE_DATE_CACHE, CHECKPOINT
+    global REFRESH_SCHEDULER, HISTORY_DB_PATH
+    HTTP_CACHE = HttpCache(cache_dir / "http", max_bytes=HTTP_CACHE_MAX_BYTES)
+    CRAWL_STATE = CrawlState(cache_dir / "crawl_state.json", max_age=CRAWL_MAX_AGE)
+    ENRICHMENT_CACHE = EnrichmentCache(cache_dir / "x_enrichment.json.gz")
+    QUERY_PLANNER = QueryPlanner(cache_dir / "query_planner.json")
+    RAFFLE_DATE_CACHE = RaffleDateCache(cache_dir / "raffle_dates.json")
+    CHECKPOINT = RunCheckpoint(cache_dir / "checkpoint.json")
+    REFRESH_SCHEDULER = RefreshScheduler(cache_dir / "refresh_schedule.json", max_intervals=REFRESH_MAX_INTERVALS)
+    HISTORY_DB_PATH = cache_dir / "history.sqlite3"
+
+
+SESSION = build_session()
+configure_state(CACHE_DIR)
+
+# Set by --record / --replay: archive every response, or send every fetch to
+# a local ReplayServer instead of the live site.
+RECORDER: ResponseArchive | None = None
+REPLAY_BASE_URL: str | None = None
+METRICS = RunMetrics()
+HOST_HEALTH = HostHealth(max_timeout=TIMEOUT_SECONDS)
+BUDGET = RunBudget()
+# Set by main: CPU-bound parsing runs here, off the threads that wait on the
+# network. Workers get raw HTML and return small records; they never touch
+# the caches or the session.
+PARSE_POOL: ProcessPoolExecutor | None = None
+
+
+def default_parse_workers() -> int:
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    # On one core the pool only adds pickling and IPC on top of the parse.
+    return cores if cores > 1 else 0
+
+
+def start_parse_pool(workers: int) -> ProcessPoolExecutor | None:
+    if workers <= 0:
+        return None
+    # fork is cheapest, and safe here because the pool is started before
+    # any other thread exists. Under fork every worker is launched on the
+    # first submit, so warm them up now.
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+    pool.submit(int).result()
+    return pool
+
+
+def run_parse(func, *args):
+    if PARSE_POOL is None:
+        return func(*args)
+    return PARSE_POOL.submit(func, *args).result()
+
+
 def fetch_html(url: str) -> str:
+    host = url_host(url)
     try:
-        response = requests.get(url, headers=HEADERS, timeout=TIMEOUT_SECONDS)
+        request_url = f"{REPLAY_BASE_URL}/{url}" if REPLAY_BASE_URL else url
+        for attempt in range(MAX_RETRIES + 1):
+            HOST_HEALTH.wait(host)
+            limiter = host_limiter(url)
+            with limiter.semaphore:
+                # Requests queue here behind slow hosts, so the deadline is
+                # checked once a slot is ours and before the rate wait: queued
+                # requests then drop out at once instead of each taking a token.
+                if BUDGET.exhausted():
+                    BUDGET.stop(current_stage.get(), 1)
+                    raise FetchSkipped(f"run stopped before {url}")
+                # Checked here, not on entry: requests already queued for a
+                # slot when the circuit opens must not go out either.
+                if attempt == 0 and not HOST_HEALTH.allow(host):
+                    METRICS.record_skip(host)
+                    # The stage is now incomplete just as at the deadline:
+                    # its callers keep their previous results for this page.
+                    BUDGET.stop(current_stage.get(), 1, reason="circuit open")
+                    raise FetchSkipped(f"circuit open for {host}: {url}")
+                limiter.bucket.acquire()
+                started = time.perf_counter()
+                try:
+                    response = SESSION.get(
+                        request_url,
+                        headers=HTTP_CACHE.conditional_headers(url),
+                        timeout=BUDGET.cap_timeout(HOST_HEALTH.timeout(host)),
+                    )
+                except Exception:
+                    METRICS.record_request(host, None, 0, time.perf_counter() - started)
+                    HOST_HEALTH.record_failure(host)
+                    raise
+                latency = time.perf_counter() - started
+                METRICS.record_request(host, response.status_code, len(response.content), latency)
+            if response.status_code in BLOCKED_STATUSES:
+                HOST_HEALTH.record_failure(host)
+                break
+            if response.status_code not in RETRY_STATUSES:
+                HOST_HEALTH.record_success(host, latency)
+                break
+            # No retry once the circuit is open, which includes this request
+            # being the probe of a circuit that is not closed yet.
+            if attempt == MAX_RETRIES or BUDGET.exhausted() or HOST_HEALTH.is_open(host):
+                HOST_HEALTH.record_failure(host)
+                break
+            # Sleep outside the limiter so other URLs on the host keep going,
+            # unless the host asked everyone to back off with Retry-After.
+            METRICS.record_retry(host)
+            time.sleep(HOST_HEALTH.retry_delay(host, attempt, parse_retry_after(response.headers.get("Retry-After"))))
+        if response.status_code == 304:
+            cached = HTTP_CACHE.get(url)
+            if cached is None:
+                raise FetchError(f"304 without cached body: {url}")
+            if RECORDER:
+                RECORDER.add(url, 200, cached)
+            return cached
+        if RECORDER:
+            RECORDER.add(url, response.status_code, response.text, response.headers.get("Content-Type"))
         response.raise_for_status()
+        HTTP_CACHE.store(
+            url,
+            response.text,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
         return response.text
+    except FetchError:
+        raise
     except Exception as exc:
         raise FetchError(str(exc)) from exc
 
@@ -139,9 +439,8 @@ def is_product_node(node: dict) -> bool:
     return node_type == "Product"
 
 
-def extract_jsonld_product(soup: BeautifulSoup) -> dict | None:
-    for script in soup.find_all("script", attrs={"type": "application/ld+json"}):
-        raw = script.string or script.get_text(strip=True)
+def extract_jsonld_product(doc: Document) -> dict | None:
+    for raw in doc.jsonld_blocks():
         if not raw:
             continue
         try:
@@ -190,11 +489,8 @@ def first_image(value) -> str | None:
     return None
 
 
-def extract_meta(soup: BeautifulSoup, key: str) -> str | None:
-    tag = soup.find("meta", attrs={"property": key}) or soup.find("meta", attrs={"name": key})
-    if not tag:
-        return None
-    return tag.get("content")
+def extract_meta(doc: Document, key: str) -> str | None:
+    return doc.meta(key)
 
 
 def parse_relative_time(text: str) -> timedelta | None:
@@ -213,16 +509,13 @@ def parse_relative_time(text: str) -> timedelta | None:
 
 
 def extract_links(html: str, base_url: str, patterns: list[str]) -> list[str]:
-    soup = BeautifulSoup(html, "html.parser")
     links = set()
-    for anchor in soup.find_all("a", href=True):
-        href = anchor["href"]
+    for href in iter_hrefs(html):
         if any(token in href for token in patterns):
             links.add(urljoin(base_url, href))
     if not links:
-        for token in patterns:
-            for match in re.findall(re.escape(token) + r"[^\"'\s>]*", html):
-                links.add(urljoin(base_url, match))
+        for match in iter_token_urls(html, tuple(patterns)):
+            links.add(urljoin(base_url, match))
     return sorted(links)
 
 
@@ -231,23 +524,42 @@ def build_id(prefix: str, url: str) -> str:
     return f"{prefix}_{hash_id}"
 
 
-def parse_product_page(url: str) -> dict:
+def parse_product_incremental(prefix: str, url: str, lastmod: datetime | None = None) -> dict:
+    if lastmod:
+        product = CRAWL_STATE.lookup_unmodified(build_id(prefix, url), lastmod)
+        if product is not None:
+            return product
     html = fetch_html(url)
-    soup = BeautifulSoup(html, "html.parser")
-    product_json = extract_jsonld_product(soup) or {}
+    key = build_id(prefix, url)
+    fingerprint = content_fingerprint(html)
+    product = CRAWL_STATE.lookup(key, fingerprint)
+    if product is None:
+        with METRICS.parse("product", url, len(html)):
+            product = run_parse(_parse_product_html, url, html)
+        CRAWL_STATE.record(key, url, fingerprint, product)
+    return product
+
+
+def parse_product_html(url: str, html: str, doc: Document | None = None) -> dict:
+    with METRICS.parse("product", url, len(html)):
+        return _parse_product_html(url, html, doc)
+
+
+def _parse_product_html(url: str, html: str, doc: Document | None = None) -> dict:
+    doc = doc or parse_html(html)
+    product_json = extract_jsonld_product(doc) or {}
 
     name = clean_text(product_json.get("name"))
     if not name:
-        title = soup.find("title")
-        name = clean_text(title.get_text()) if title else ""
+        name = clean_text(doc.title())
 
     description = clean_text(product_json.get("description"))
     if not description:
-        description = clean_text(extract_meta(soup, "description"))
+        description = clean_text(extract_meta(doc, "description"))
 
     image = first_image(product_json.get("image"))
     if not image:
-        image = extract_meta(soup, "og:image")
+        image = extract_meta(doc, "og:image")
     if image:
         image = urljoin(url, image)
 
@@ -279,135 +591,291 @@ def parse_product_page(url: str) -> dict:
 
 def make_product(prefix: str, category: str, store_id: str, store_name: str, product: dict) -> dict:
     now = datetime.now(timezone.utc).isoformat()
-    return {
-        "id": build_id(prefix, product["url"]),
-        "name": product["name"],
-        "category": category,
-        "imageUrl": product["image"],
-        "description": product["description"] or product["name"],
-        "prices": [
-            {
-                "storeId": store_id,
-                "storeName": store_name,
-                "price": float(product["price"]),
-                "inStock": bool(product["in_stock"]),
-                "location": "\u30aa\u30f3\u30e9\u30a4\u30f3",
-                "url": product["url"],
-                "lastUpdated": now,
-            }
-        ],
-    }
-
-
-def fetch_sanrio_products() -> list[dict]:
-    products = []
+    return Product(
+        id=build_id(prefix, product["url"]),
+        name=product["name"],
+        category=category,
+        image_url=product["image"],
+        description=product["description"] or product["name"],
+        prices=(
+            PriceEntry(
+                store_id=store_id,
+                store_name=store_name,
+                price=float(product["price"]),
+                in_stock=bool(product["in_stock"]),
+                location="\u30aa\u30f3\u30e9\u30a4\u30f3",
+                url=product["url"],
+                last_updated=now,
+            ),
+        ),
+    ).to_json()
+
+
+def discover_listing_links(
+    list_url: str,
+    page_patterns: list[str],
+    is_page: Callable[[str], bool],
+    detail_patterns: list[str],
+    max_pages: int | None = None,
+) -> Iterator[str]:
+    """Detail links from a paginated listing, reading at most max_pages pages.
+
+    Page links are taken from every listing page read, not just the first,
+    so a pager that only shows nearby page numbers is still walked on.
+    """
+    max_pages = max_pages or LISTING_MAX_PAGES
+    page_urls = {list_url}
     seen_urls = set()
-    html = fetch_html(SANRIO_LIST_URL)
-    page_urls = {SANRIO_LIST_URL}
-
-    for link in extract_links(html, SANRIO_LIST_URL, ["category_id=130", "page="]):
-        if "category_id=130" in link:
-            page_urls.add(link)
-        if len(page_urls) >= 5:
-            break
-
-    for page_url in sorted(page_urls):
-        page_html = html if page_url == SANRIO_LIST_URL else fetch_html(page_url)
-        for link in extract_links(page_html, SANRIO_LIST_URL, ["/item/detail/"]):
-            if link in seen_urls:
-                continue
-            seen_urls.add(link)
-            try:
-                product = parse_product_page(link)
-            except FetchError:
+    pages = [fetch_html(list_url)]
+    while pages:
+        next_urls = []
+        for page_html in pages:
+            if page_html is None:
                 continue
-            if product["name"]:
-                products.append(
-                    make_product(
-                        "sanrio",
-                        "\u30b5\u30f3\u30ea\u30aa",
-                        "sanrio_official",
-                        "\u30b5\u30f3\u30ea\u30aa\u516c\u5f0f\u30aa\u30f3\u30e9\u30a4\u30f3\u30b7\u30e7\u30c3\u30d7",
-                        product,
-                    )
-                )
-    return products
+            for link in extract_links(page_html, list_url, page_patterns):
+                if len(page_urls) < max_pages and link not in page_urls and is_page(link):
+                    page_urls.add(link)
+                    next_urls.append(link)
+            for link in extract_links(page_html, list_url, detail_patterns):
+                if link in seen_urls:
+                    continue
+                seen_urls.add(link)
+                yield link
+        pages = imap_concurrent(fetch_html, sorted(next_urls)) if next_urls else []
+
+
+def discover_sanrio_links() -> Iterator[str]:
+    return discover_listing_links(
+        SANRIO_LIST_URL,
+        ["category_id=130", "page="],
+        lambda link: "category_id=130" in link,
+        ["/item/detail/"],
+    )
 
 
-def fetch_tamagotchi_products() -> list[dict]:
-    products = []
-    seen_urls = set()
+def discover_tamagotchi_links() -> Iterator[str]:
     html = fetch_html(TAMAGOTCHI_LIST_URL)
     links = extract_links(html, TAMAGOTCHI_LIST_URL, ["/jp/item/"])
+    item_links = {link for link in links if TAMAGOTCHI_ITEM_PATTERN.search(link)}
+    yield from sorted(item_links)[:120]
 
-    item_links = []
-    for link in links:
-        if re.search(r"/jp/item/\d{2}_\d+/?$", link):
-            item_links.append(link)
 
-    for link in sorted(set(item_links))[:120]:
-        if link in seen_urls:
-            continue
-        seen_urls.add(link)
+def discover_qlia_links() -> Iterator[str]:
+    return discover_listing_links(
+        QLIA_CATEGORY_URL,
+        ["page=", "pno="],
+        lambda link: "cbid=2943125" in link and "csid=16" in link,
+        ["?pid="],
+    )
+
+
+class ProductSource(NamedTuple):
+    prefix: str
+    category: str
+    store_id: str
+    store_name: str
+    discover: Callable[[], Iterable[str]]
+    accept: Callable[[dict], bool]
+    # Sitemap discovery; only for shops whose sitemap product URLs are all
+    # in scope (or are filtered by accept after parsing).
+    sitemap_site: str | None = None
+    sitemap_product: re.Pattern | None = None
+
+
+PRODUCT_SOURCES = {
+    "sanrio": ProductSource(
+        "sanrio",
+        "\u30b5\u30f3\u30ea\u30aa",
+        "sanrio_official",
+        "\u30b5\u30f3\u30ea\u30aa\u516c\u5f0f\u30aa\u30f3\u30e9\u30a4\u30f3\u30b7\u30e7\u30c3\u30d7",
+        discover_sanrio_links,
+        lambda product: True,
+    ),
+    "tamagotchi": ProductSource(
+        "tamagotchi",
+        "\u305f\u307e\u3054\u3063\u3061",
+        "tamagotchi_official",
+        "\u305f\u307e\u3054\u3063\u3061\u516c\u5f0f\u30b5\u30a4\u30c8",
+        discover_tamagotchi_links,
+        lambda product: any(token in product["name"] for token in TAMAGOTCHI_MATCH),
+        "https://tamagotchi-official.com/",
+        TAMAGOTCHI_ITEM_PATTERN,
+    ),
+    "qlia": ProductSource(
+        "bonbondrop",
+        "\u30dc\u30f3\u30dc\u30f3\u30c9\u30ed\u30c3\u30d7",
+        "bonbondrop_official",
+        "\u30dc\u30f3\u30dc\u30f3\u30c9\u30ed\u30c3\u30d7\u516c\u5f0f\u30aa\u30f3\u30e9\u30a4\u30f3\u30b7\u30e7\u30c3\u30d7",
+        discover_qlia_links,
+        lambda product: product["in_stock"],
+    ),
+}
+
+
+def fetch_optional(url: str) -> str | None:
+    try:
+        return fetch_html(url)
+    except FetchError:
+        return None
+
+
+def discover_product_links(source: ProductSource) -> Iterator[tuple[str, datetime | None]]:
+    """Product links with their sitemap lastmod, or from the listing crawl.
+
+    The listing crawl only runs when the shop has no usable sitemap.
+    """
+    if source.sitemap_site:
+        found = False
+        for entry in iter_sitemap_products(source.sitemap_site, fetch_optional, source.sitemap_product.search):
+            found = True
+            yield entry.url, entry.lastmod
+        if found:
+            return
+    for link in source.discover():
+        yield link, None
+
+
+def prioritize_product_links(
+    source: ProductSource,
+    links: list[tuple[str, datetime | None]],
+) -> list[tuple[str, datetime | None]]:
+    """Links ordered by what a visit is likely to be worth.
+
+    Products last seen sold out come first (a restock is the news users
+    watch for), then products never parsed before, then pages changed
+    since their last parse, then the rest. Discovery order breaks ties.
+    """
+    known = CRAWL_STATE.snapshot()
+
+    def rank(item: tuple[str, datetime | None]) -> int:
+        link, lastmod = item
+        entry = known.get(build_id(source.prefix, link))
+        if entry is None:
+            return 1
+        if not entry.get("product", {}).get("in_stock", True):
+            return 0
         try:
-            product = parse_product_page(link)
-        except FetchError:
-            continue
-        name = product["name"]
-        if not name:
-            continue
-        if not any(token in name for token in TAMAGOTCHI_MATCH):
+            return 2 if lastmod and lastmod > datetime.fromisoformat(entry["parsedAt"]) else 3
+        except (KeyError, ValueError):
+            return 2
+
+    return sorted(links, key=rank)
+
+
+def fetch_source_product(source: ProductSource, link: str, lastmod: datetime | None = None) -> dict | None:
+    """The shop's product for one detail page, or None when the page is filtered out."""
+    product = parse_product_incremental(source.prefix, link, lastmod)
+    if not product["name"] or not source.accept(product):
+        return None
+    try:
+        return make_product(source.prefix, source.category, source.store_id, source.store_name, product)
+    except ValueError as exc:
+        print(f"skipping invalid product {link}: {exc}")
+        return None
+
+
+def stream_products(name: str) -> Iterator[dict]:
+    """Discovery -> fetch -> parse for one shop, one product at a time.
+
+    Each handled detail link goes into the run checkpoint (None for pages
+    that were filtered out), so a resumed run only visits the rest.
+    """
+    source = PRODUCT_SOURCES[name]
+    stage = f"products.{name}"
+    done = CHECKPOINT.items(stage)
+    for product in done.values():
+        if product:
+            yield product
+
+    def fetch_and_parse(item: tuple[str, datetime | None]) -> tuple[str, dict | None]:
+        return item[0], fetch_source_product(source, *item)
+
+    links = (item for item in discover_product_links(source) if item[0] not in done)
+    if BUDGET.deadline is not None:
+        # Without a deadline every link is visited anyway, so discovery
+        # stays streamed; with one, the most valuable pages go first.
+        links = prioritize_product_links(source, list(links))
+    for result in imap_concurrent(fetch_and_parse, links):
+        if result is None:
             continue
-        products.append(
-            make_product(
-                "tamagotchi",
-                "\u305f\u307e\u3054\u3063\u3061",
-                "tamagotchi_official",
-                "\u305f\u307e\u3054\u3063\u3061\u516c\u5f0f\u30b5\u30a4\u30c8",
-                product,
-            )
-        )
-    return products
+        link, product = result
+        CHECKPOINT.add(stage, link, product)
+        if product:
+            yield product
 
 
-def fetch_qlia_products() -> list[dict]:
-    products = []
-    seen_urls = set()
-    html = fetch_html(QLIA_CATEGORY_URL)
-    page_urls = {QLIA_CATEGORY_URL}
+def fetch_products(name: str) -> list[dict]:
+    return list(stream_products(name))
 
-    for link in extract_links(html, QLIA_CATEGORY_URL, ["page=", "pno="]):
-        if "cbid=2943125" in link and "csid=16" in link:
-            page_urls.add(link)
-        if len(page_urls) >= 5:
-            break
 
-    for page_url in sorted(page_urls):
-        page_html = html if page_url == QLIA_CATEGORY_URL else fetch_html(page_url)
-        links = extract_links(page_html, QLIA_CATEGORY_URL, ["?pid="])
+def store_products(products: list[dict], store_id: str) -> list[dict]:
+    return [
+        product for product in products
+        if any(price["storeId"] == store_id for price in product.get("prices", []))
+    ]
 
-        for link in links:
-            if link in seen_urls:
-                continue
-            seen_urls.add(link)
-            try:
-                product = parse_product_page(link)
-            except FetchError:
-                continue
-            name = product["name"]
-            if not name:
-                continue
-            if not product["in_stock"]:
-                continue
-            products.append(
-                make_product(
-                    "bonbondrop",
-                    "\u30dc\u30f3\u30dc\u30f3\u30c9\u30ed\u30c3\u30d7",
-                    "bonbondrop_official",
-                    "\u30dc\u30f3\u30dc\u30f3\u30c9\u30ed\u30c3\u30d7\u516c\u5f0f\u30aa\u30f3\u30e9\u30a4\u30f3\u30b7\u30e7\u30c3\u30d7",
-                    product,
-                )
-            )
+
+def sold_out_links(source: ProductSource) -> list[str]:
+    """Detail pages last seen sold out that the shop would list if they were in stock.
+
+    Read from the crawl state rather than the shop's products: a source
+    whose accept() drops sold-out items (qlia) never lists them.
+    """
+    links = []
+    for key, entry in CRAWL_STATE.snapshot().items():
+        product = entry.get("product") or {}
+        if (
+            key.startswith(f"{source.prefix}_")
+            and product.get("name")
+            and not product.get("in_stock", True)
+            and source.accept({**product, "in_stock": True})
+        ):
+            links.append(entry["url"])
+    return sorted(links)
+
+
+def refresh_sold_out(name: str, products: list[dict]) -> list[dict]:
+    """The shop's previous products with its sold-out pages fetched again.
+
+    Runs while the listing crawl is backed off, so a restock still shows up
+    on the next run. A page that could not be fetched keeps its previous
+    entry.
+    """
+    source = PRODUCT_SOURCES[name]
+    links = sold_out_links(source)
+    refreshed = {}
+    for result in map_concurrent(lambda link: (link, fetch_source_product(source, link)), links):
+        if result is not None:
+            link, product = result
+            refreshed[build_id(source.prefix, link)] = product
+    return [product for product in products if product["id"] not in refreshed] + [
+        product for product in refreshed.values() if product
+    ]
+
+
+def fetch_products_when_due(name: str, previous_products: list[dict]) -> list[dict]:
+    """This run's products for a shop; while it is not due, its previous ones with sold-out pages rechecked."""
+    if not REFRESH_SCHEDULER.is_due(f"products.{name}"):
+        return refresh_sold_out(name, store_products(previous_products, PRODUCT_SOURCES[name].store_id))
+    products = fetch_products(name)
+    if BUDGET.truncated(f"products.{name}"):
+        # Stopped at the deadline or by an open circuit: keep the pages not
+        # reached this run, and leave the shop due so the next run finishes
+        # it. Visited pages come from the checkpoint, which also holds the
+        # ones accept() dropped: a page that sold out this run must not keep
+        # its in-stock entry.
+        source = PRODUCT_SOURCES[name]
+        visited = {build_id(source.prefix, link) for link in CHECKPOINT.items(f"products.{name}")}
+        return products + [
+            product for product in store_products(previous_products, source.store_id)
+            if product["id"] not in visited
+        ]
+    prices = sorted(
+        (product["id"], product["name"], price["price"], price["inStock"])
+        for product in products
+        for price in product["prices"]
+    )
+    REFRESH_SCHEDULER.record(f"products.{name}", result_fingerprint(prices))
     return products
 
 
@@ -445,31 +913,58 @@ def normalize_ddg_url(url: str) -> str:
     return url
 
 
-def extract_date_candidates(text: str, now: datetime) -> list[datetime]:
-    candidates = []
-    year_spans = []
-    for match in DATE_WITH_YEAR.finditer(text):
-        year, month, day = map(int, match.groups())
-        try:
-            candidates.append(datetime(year, month, day, tzinfo=now.tzinfo))
-            year_spans.append((match.start(), match.end()))
-        except ValueError:
-            continue
-    for match in DATE_NO_YEAR.finditer(text):
-        if any(start <= match.start() < end for start, end in year_spans):
-            continue
-        month, day = map(int, match.groups())
-        try:
-            candidate = datetime(now.year, month, day, tzinfo=now.tzinfo)
-        except ValueError:
-            continue
-        if candidate < now:
-            next_year = datetime(now.year + 1, month, day, tzinfo=now.tzinfo)
-            if next_year <= now + timedelta(days=31):
-                candidates.append(next_year)
-            else:
-                candidates.append(candidate)
+def keyword_windows(text: str, keyword: str, radius: int) -> list[tuple[int, int]]:
+    windows = []
+    position = text.find(keyword)
+    while position != -1:
+        start, end = max(0, position - radius), position + len(keyword) + radius
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], end)
         else:
+            windows.append((start, end))
+        position = text.find(keyword, position + len(keyword))
+    return windows
+
+
+def date_scan_start(text: str, start: int) -> int:
+    while start > 0 and (text[start - 1].isdecimal() or text[start - 1].isspace() or text[start - 1] in DATE_JOINERS):
+        start -= 1
+    return start
+
+
+def extract_date_candidates(
+    text: str,
+    now: datetime,
+    anchor: str | None = None,
+    radius: int = RAFFLE_DATE_WINDOW,
+) -> list[datetime]:
+    windows = keyword_windows(text, anchor, radius) if anchor else [(0, len(text))]
+    candidates = []
+    position = 0
+    for start, end in windows:
+        # A date may cross either edge of its window: scan from a point no
+        # date spans and keep each match that overlaps the window, so a
+        # window reads the same dates as the full text does.
+        position = max(position, date_scan_start(text, start))
+        for match in DATE_PATTERN.finditer(text, position):
+            if match.start() >= end:
+                break
+            position = match.end()
+            if position <= start:
+                continue
+            year, month, day = match.groups()
+            month, day = int(month), int(day)
+            try:
+                if year:
+                    candidates.append(datetime(int(year), month, day, tzinfo=now.tzinfo))
+                    continue
+                candidate = datetime(now.year, month, day, tzinfo=now.tzinfo)
+            except ValueError:
+                continue
+            if candidate < now:
+                next_year = datetime(now.year + 1, month, day, tzinfo=now.tzinfo)
+                if next_year <= now + timedelta(days=31):
+                    candidate = next_year
             candidates.append(candidate)
     return candidates
 
@@ -485,21 +980,26 @@ def select_upcoming_date(candidates: list[datetime], now: datetime, window_days:
 def search_duckduckgo(query: str, max_results: int = 12) -> list[dict]:
     url = "https://duckduckgo.com/html/?q=" + quote(query)
     html = fetch_html(url)
-    soup = BeautifulSoup(html, "html.parser")
+    with METRICS.parse("duckduckgo", url, len(html)):
+        return _parse_duckduckgo_results(html, max_results)
+
+
+def _parse_duckduckgo_results(html: str, max_results: int) -> list[dict]:
+    doc = parse_html(html)
     results = []
-    for result in soup.select("div.result"):
+    for result in doc.select("div.result"):
         link = result.select_one("a.result__a")
         if not link:
             continue
-        raw_url = link.get("href")
+        raw_url = link.attr("href")
         if not raw_url:
             continue
         target_url = normalize_ddg_url(raw_url)
         if not target_url.startswith("http"):
             continue
-        title = clean_text(link.get_text())
+        title = clean_text(link.text())
         snippet_tag = result.select_one(".result__snippet")
-        snippet = clean_text(snippet_tag.get_text()) if snippet_tag else ""
+        snippet = clean_text(snippet_tag.text()) if snippet_tag else ""
         results.append({
             "title": title,
             "url": target_url,
@@ -512,20 +1012,30 @@ def search_duckduckgo(query: str, max_results: int = 12) -> list[dict]:
 
 def extract_raffle_date(title: str, snippet: str, url: str, now: datetime) -> datetime | None:
     combined = f"{title} {snippet}"
-    if "抽選" not in combined:
+    if RAFFLE_KEYWORD not in combined:
         return None
     candidates = extract_date_candidates(combined, now)
     selected = select_upcoming_date(candidates, now)
     if selected:
         return selected
+
+    found, cached = RAFFLE_DATE_CACHE.lookup(url)
+    if found:
+        # A cached date may have passed since it was resolved.
+        return select_upcoming_date([cached], now) if cached else None
     try:
         html = fetch_html(url)
     except FetchError:
         return None
-    text = BeautifulSoup(html, "html.parser").get_text(" ", strip=True)
-    if "抽選" not in text:
-        return None
-    candidates = extract_date_candidates(text, now)
+    with METRICS.parse("raffle", url, len(html)):
+        selected = run_parse(_raffle_date_from_html, html, now)
+    RAFFLE_DATE_CACHE.record(url, selected)
+    return selected
+
+
+def _raffle_date_from_html(html: str, now: datetime) -> datetime | None:
+    text = parse_html(html).text()
+    candidates = extract_date_candidates(text, now, anchor=RAFFLE_KEYWORD)
     return select_upcoming_date(candidates, now)
 
 
@@ -534,83 +1044,84 @@ def fetch_raffle_posts() -> list[dict]:
     results = search_duckduckgo("\u30dc\u30f3\u30dc\u30f3\u30c9\u30ed\u30c3\u30d7\u30b7\u30fc\u30eb \u62bd\u9078", max_results=12)
     posts = []
     seen_urls = set()
+    unique_results = []
 
     for item in results:
-        url = item["url"]
-        if url in seen_urls:
+        if item["url"] in seen_urls:
             continue
-        seen_urls.add(url)
-        raffle_date = extract_raffle_date(item["title"], item["snippet"], url, now)
+        seen_urls.add(item["url"])
+        unique_results.append(item)
+
+    raffle_dates = map_concurrent(
+        lambda item: extract_raffle_date(item["title"], item["snippet"], item["url"], now),
+        unique_results,
+    )
+    for item, raffle_date in zip(unique_results, raffle_dates):
+        url = item["url"]
         if not raffle_date:
             continue
         date_str = raffle_date.strftime("%Y-%m-%d")
         content = f"\u62bd\u9078\u60c5\u5831: {item['title']} / \u62bd\u9078\u65e5: {date_str}"
-        posts.append({
-            "id": build_id("raffle", url),
-            "type": "other",
-            "productId": build_id("raffle", url),
-            "username": "\u62bd\u9078\u60c5\u5831",
-            "content": content,
-            "imageUrl": None,
-            "postUrl": url,
-            "postedAt": now.isoformat(),
-            "storeName": None,
-            "location": None,
-            "price": None,
-            "isVerified": False,
-        })
+        posts.append(SnsPost(
+            id=build_id("raffle", url),
+            type="other",
+            product_id=build_id("raffle", url),
+            username="\u62bd\u9078\u60c5\u5831",
+            content=content,
+            post_url=url,
+            posted_at=now.isoformat(),
+        ).to_json())
 
     return posts
 
 
-def search_yahoo_realtime(keyword: str) -> list[dict]:
+def fetch_raffle_posts_when_due() -> list[dict]:
+    # Raffle posts from earlier runs stay in the feed through merge_posts.
+    if not REFRESH_SCHEDULER.is_due("raffle"):
+        return []
+    posts = fetch_raffle_posts()
+    if BUDGET.truncated("raffle"):
+        return posts
+    REFRESH_SCHEDULER.record("raffle", result_fingerprint(sorted(post["content"] for post in posts)))
+    return posts
+
+
+def search_yahoo_realtime(keyword: str, query: str | None = None) -> list[dict]:
     url = (
         "https://search.yahoo.co.jp/realtime/search?p="
-        + quote(keyword)
+        + quote(query or keyword)
         + "&ei=UTF-8"
     )
     html = fetch_html(url)
     results = []
-    seen = set()
     now = datetime.now(timezone.utc)
+    store_name = infer_store_name(keyword)
+    location = infer_location(keyword)
 
-    for match in re.finditer(r"https://(?:twitter\.com|x\.com)/[^/]+/status/\d+", html):
-        link = match.group(0)
-        if link in seen:
-            continue
-        seen.add(link)
-        window = html[max(0, match.start() - 200): match.end() + 200]
-        delta = parse_relative_time(window)
+    with METRICS.parse("yahoo_realtime", url, len(html)):
+        links = scan_x_statuses(html, limit=X_MAX_URLS_PER_KEYWORD)
+    for link in links:
+        delta = parse_relative_time(link.relative_time) if link.relative_time else None
         posted_at = now - delta if delta else now
 
-        username_match = re.search(r"/(?:twitter\.com|x\.com)/([^/]+)/status/", link)
-        username = "@" + username_match.group(1) if username_match else "@unknown"
-        status_id = re.search(r"/status/(\d+)", link)
-        status_id = status_id.group(1) if status_id else build_id("x", link)
-
-        results.append({
-            "id": f"x_{status_id}",
-            "type": "twitter",
-            "productId": f"x_{status_id}",
-            "username": username,
-            "content": f"{keyword} \u306b\u95a2\u3059\u308b\u6295\u7a3f",
-            "imageUrl": None,
-            "postUrl": link,
-            "postedAt": posted_at.isoformat(),
-            "storeName": infer_store_name(keyword),
-            "location": infer_location(keyword),
-            "price": None,
-            "isVerified": False,
-        })
-
-        if len(results) >= X_MAX_URLS_PER_KEYWORD:
-            break
+        results.append(SnsPost(
+            id=f"x_{link.status_id}",
+            type="twitter",
+            product_id=f"x_{link.status_id}",
+            username="@" + link.username,
+            content=f"{keyword}{X_PLACEHOLDER_SUFFIX}",
+            post_url=link.url,
+            posted_at=posted_at.isoformat(),
+            store_name=store_name,
+            location=location,
+        ).to_json())
 
     return results
 
 
 def _strip_html(text: str) -> str:
-    return BeautifulSoup(text, "html.parser").get_text(" ", strip=True)
+    with METRICS.parse("oembed", size=len(text)):
+        return parse_html(text).text()
 
 
 def fetch_x_oembed_text(url: str) -> str | None:
@@ -619,13 +1130,12 @@ def fetch_x_oembed_text(url: str) -> str | None:
             "https://publish.twitter.com/oembed?omit_script=1&url="
             + quote(url, safe="")
         )
-        response = requests.get(oembed_url, headers=HEADERS, timeout=TIMEOUT_SECONDS)
-        if response.status_code != 200:
-            return None
-        payload = response.json()
+        payload = json.loads(fetch_html(oembed_url))
         html = payload.get("html", "")
         text = _strip_html(html)
         return text or None
+    except FetchSkipped:
+        raise
     except Exception:
         return None
 
@@ -633,70 +1143,255 @@ def fetch_x_oembed_text(url: str) -> str | None:
 def fetch_x_og_text(url: str) -> str | None:
     try:
         html = fetch_html(url)
+    except FetchSkipped:
+        raise
     except FetchError:
         return None
-    soup = BeautifulSoup(html, "html.parser")
-    meta = soup.find("meta", attrs={"property": "og:description"})
-    if not meta:
-        meta = soup.find("meta", attrs={"name": "description"})
-    if not meta:
-        return None
-    content = meta.get("content")
+    with METRICS.parse("x_og", url, len(html)):
+        content = run_parse(_og_description, html)
     if not content:
         return None
     return clean_text(content)
 
 
-def enrich_x_post_content(posts: list[dict], limit: int = 25) -> None:
-    for index, post in enumerate(posts):
-        if index >= limit:
-            break
-        url = post.get("postUrl")
-        if not url:
+def _og_description(html: str) -> str | None:
+    doc = parse_html(html)
+    return doc.meta("og:description") or doc.meta("description")
+
+
+def enrich_x_post_content(posts: list[dict], max_lookups: int = X_ENRICH_MAX_LOOKUPS) -> list[dict]:
+    pending = []
+    for post in posts:
+        if post.get("type") != "twitter":
+            continue
+        status_match = X_STATUS_ID_PATTERN.search(post.get("postUrl") or "")
+        if not status_match:
+            continue
+        status_id = status_match.group(1)
+        found, text = ENRICHMENT_CACHE.lookup(status_id)
+        if found:
+            if text:
+                post["content"] = text
+        elif len(pending) < max_lookups:
+            pending.append((post, status_id))
+
+    def look_up(item: tuple[dict, str]) -> tuple[str | None, float | None]:
+        url = item[0]["postUrl"]
+        text = fetch_x_oembed_text(url)
+        if text:
+            return text, None
+        try:
+            return fetch_x_og_text(url), None
+        except FetchSkipped:
+            return None, X_ENRICH_PARTIAL_MISS_TTL
+
+    # A lookup that sent no request at all (FetchSkipped on oEmbed) comes back
+    # as None from map_concurrent and is not cached: it is not a failed lookup.
+    results = map_concurrent(look_up, pending)
+    for (post, status_id), result in zip(pending, results):
+        if result is None:
             continue
-        text = fetch_x_oembed_text(url) or fetch_x_og_text(url)
+        text, ttl = result
+        ENRICHMENT_CACHE.record(status_id, text, ttl)
         if text:
             post["content"] = text
-        time.sleep(0.3)
+    return posts
 
 
-def fetch_x_posts_for_keywords(keywords: list[str]) -> list[dict]:
-    posts = []
-    seen_urls = set()
+def parse_shard(value: str) -> tuple[int, int]:
+    index, _, count = value.partition("/")
+    try:
+        shard = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT, got {value!r}") from None
+    if not 0 <= shard[0] < shard[1]:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..{shard[1] - 1}, got {value!r}")
+    return shard
+
+
+def parse_deadline(value: str) -> datetime:
+    """An ISO 8601 time, or a duration from now such as 40m, 90s or 1h."""
+    match = re.fullmatch(r"(\d+)([smh])", value.strip())
+    if match:
+        unit = {"s": "seconds", "m": "minutes", "h": "hours"}[match.group(2)]
+        return datetime.now(timezone.utc) + timedelta(**{unit: int(match.group(1))})
+    try:
+        deadline = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a duration like 40m or an ISO time, got {value!r}") from None
+    return deadline if deadline.tzinfo else deadline.astimezone()
 
-    for keyword in keywords:
-        try:
-            keyword_posts = search_yahoo_realtime(keyword)
-        except FetchError:
-            keyword_posts = []
 
-        for post in keyword_posts:
+def in_shard(key: str, shard: tuple[int, int] | None) -> bool:
+    # Hash-based so a query keeps its shard when the keyword lists change.
+    if shard is None:
+        return True
+    index, count = shard
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:8], 16) % count == index
+
+
+def dedup_posts(post_lists: Iterable[list[dict] | None]) -> list[dict]:
+    posts = []
+    seen_urls = set()
+    for query_posts in post_lists:
+        for post in query_posts or []:
             if post["postUrl"] in seen_urls:
                 continue
             seen_urls.add(post["postUrl"])
             posts.append(post)
-
-        time.sleep(X_REQUEST_DELAY_SECONDS)
-
     posts.sort(key=lambda item: item["postedAt"], reverse=True)
     return posts
 
 
-def write_json(path: Path, payload: list[dict]):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as handle:
-        json.dump(payload, handle, ensure_ascii=True, indent=2)
+def fetch_x_posts_for_keywords(
+    keywords: list[str],
+    feed: str | None = None,
+    shard: tuple[int, int] | None = None,
+) -> list[dict]:
+    deferred = []
+    if feed is None:
+        queries = [PlannedQuery(keyword, keyword, (keyword,)) for keyword in keywords]
+    else:
+        # A probe run measures the whole plan, so the scheduler defers none
+        # of its queries.
+        probe = QUERY_PLANNER.is_probe_run(feed)
+        queries = []
+        for query in QUERY_PLANNER.plan(feed, keywords, CITY_TO_PREF):
+            # A city query shards with its merged group, so a probe run can
+            # compare the two within one process.
+            if not in_shard(query.group or query.query, shard):
+                continue
+            if probe or REFRESH_SCHEDULER.is_due(f"x_search.{feed}:{query.query}"):
+                queries.append(query)
+            else:
+                deferred.append(query)
 
+    stage = f"x_search.{feed}"
+    done = CHECKPOINT.items(stage) if feed else {}
 
-def main() -> int:
-    all_products = []
-    seen = set()
+    not_sent = set()
+
+    def search(query: PlannedQuery) -> list[dict]:
+        if query.query in done:
+            return done[query.query]
+        try:
+            query_posts = search_yahoo_realtime(query.label, query.query)
+        except FetchSkipped:
+            not_sent.add(query.query)
+            raise
+        if feed:
+            CHECKPOINT.add(stage, query.query, query_posts)
+        return query_posts
+
+    results = map_concurrent(search, queries)
+    if feed is not None and (queries or deferred):
+        # Queries past the deadline were never scheduled and have no result.
+        cut = [query for query in queries[:len(results)] if query.query in not_sent] + queries[len(results):]
+        report = QUERY_PLANNER.record(
+            feed,
+            [
+                (query, None if query_posts is None else [post["postUrl"] for post in query_posts])
+                for query, query_posts in zip(queries, results)
+                if query.query not in not_sent
+            ],
+            deferred + cut,
+            truncated=bool(cut),
+        )
+        print(format_report(report))
+        for query, query_posts in zip(queries, results):
+            if query_posts is not None:
+                REFRESH_SCHEDULER.record(
+                    f"x_search.{feed}:{query.query}",
+                    result_fingerprint(sorted(post["postUrl"] for post in query_posts)),
+                )
+    return dedup_posts(results)
+
+
+def is_placeholder_post(post: dict) -> bool:
+    return post.get("type") == "twitter" and (post.get("content") or "").endswith(X_PLACEHOLDER_SUFFIX)
 
-    for fetcher in (fetch_sanrio_products, fetch_tamagotchi_products, fetch_qlia_products):
+
+def is_collapsible_post(post: dict) -> bool:
+    return post.get("type") == "twitter" and not is_placeholder_post(post)
+
+
+def write_json(path: Path, payload: list[dict]) -> dict:
+    return write_output(path, payload, path.parent)
+
+
+def run_stage(name: str, func, *args, **kwargs):
+    found, result = CHECKPOINT.result(name)
+    if found:
+        print(f"{name}: resumed from checkpoint")
+        return result
+    with METRICS.stage(name):
+        result = func(*args, **kwargs)
+    # A stage cut short by the deadline is not marked complete, so if the
+    # run dies before publishing, the resumed run finishes the stage instead
+    # of taking its partial result as whole.
+    if not BUDGET.truncated(name):
+        CHECKPOINT.complete(name, result)
+    return result
+
+
+FETCH_STAGES = (
+    *(f"products.{name}" for name in PRODUCT_SOURCES),
+    "x_search.bonbon",
+    "raffle",
+    "x_search.gacha",
+)
+PARTIAL_VERSION = 1
+
+
+def collect_stages(
+    stages: list[str],
+    previous_products: list[dict],
+    shard: tuple[int, int] | None = None,
+) -> dict[str, list[dict] | None]:
+    """Run the selected fetch stages; a stage that failed maps to None."""
+    bonbon_keywords = BONBON_BASE_KEYWORDS + BONBON_STORE_KEYWORDS + BONBON_CITY_KEYWORDS
+    gacha_keywords = GACHA_BASE_KEYWORDS + GACHA_CITY_KEYWORDS
+    calls = {f"products.{name}": (fetch_products_when_due, name, previous_products) for name in PRODUCT_SOURCES}
+    calls["x_search.bonbon"] = (fetch_x_posts_for_keywords, bonbon_keywords, "bonbon", shard)
+    calls["raffle"] = (fetch_raffle_posts_when_due,)
+    calls["x_search.gacha"] = (fetch_x_posts_for_keywords, gacha_keywords, "gacha", shard)
+
+    # Stages hit different hosts, so run them side by side; each host's
+    # limiter still caps how hard any single site is hit.
+    with ThreadPoolExecutor(max_workers=max(1, len(stages))) as pool:
+        futures = {stage: pool.submit(run_stage, stage, *calls[stage]) for stage in stages}
+    results = {}
+    for stage, future in futures.items():
         try:
-            products = fetcher()
+            results[stage] = future.result()
         except FetchError:
-            products = []
+            results[stage] = None
+
+    if REFRESH_SCHEDULER.deferred:
+        groups = {}
+        for source in REFRESH_SCHEDULER.deferred:
+            group = source.partition(":")[0]
+            groups[group] = groups.get(group, 0) + 1
+        print(
+            f"[scheduler] {len(REFRESH_SCHEDULER.deferred)} sources not due ("
+            + ", ".join(f"{group} {count}" for group, count in sorted(groups.items()))
+            + ")"
+        )
+    return results
+
+
+def combine_stages(
+    results: dict[str, list[dict] | None],
+    previous_products: list[dict],
+) -> tuple[list[dict], list[dict], list[dict]]:
+    all_products = []
+    seen = set()
+    for name, source in PRODUCT_SOURCES.items():
+        products = results.get(f"products.{name}")
+        if products is None:
+            # Not run in this process (or its shard failed): keep the shop's
+            # last known products rather than dropping them from the export.
+            products = store_products(previous_products, source.store_id)
         for product in products:
             url = product["prices"][0]["url"]
             if url in seen:
@@ -706,11 +1401,8 @@ def main() -> int:
 
     all_products.sort(key=lambda item: item["name"])
 
-    bonbon_keywords = BONBON_BASE_KEYWORDS + BONBON_STORE_KEYWORDS + BONBON_CITY_KEYWORDS
-    gacha_keywords = GACHA_BASE_KEYWORDS + GACHA_CITY_KEYWORDS
-
-    bonbon_posts = fetch_x_posts_for_keywords(bonbon_keywords)
-    raffle_posts = fetch_raffle_posts()
+    bonbon_posts = list(results.get("x_search.bonbon") or [])
+    raffle_posts = results.get("raffle") or []
     if raffle_posts:
         seen = {post["postUrl"] for post in bonbon_posts}
         for post in raffle_posts:
@@ -719,15 +1411,254 @@ def main() -> int:
             bonbon_posts.append(post)
             seen.add(post["postUrl"])
 
-    gacha_posts = fetch_x_posts_for_keywords(gacha_keywords)
+    gacha_posts = list(results.get("x_search.gacha") or [])
+    return all_products, bonbon_posts, gacha_posts
+
+
+def write_partial(path: Path, results: dict, only: list[str] | None, shard: tuple[int, int] | None) -> None:
+    partial = {
+        "version": PARTIAL_VERSION,
+        "only": only,
+        "shard": f"{shard[0]}/{shard[1]}" if shard else None,
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        # Failed stages are left out so the merge treats them as not run.
+        "stages": {stage: result for stage, result in results.items() if result is not None},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(serialize(partial))
+    tmp_path.replace(path)
+
+
+def load_partials(paths: list[Path]) -> dict[str, list[dict]]:
+    """Stage results from shard partials, combined in path order.
+
+    Lists for the same stage are concatenated; search results from keyword
+    shards then go through the same URL dedup and ordering as one process.
+    """
+    results: dict[str, list[dict]] = {}
+    for path in sorted(paths):
+        with path.open("r", encoding="utf-8") as handle:
+            partial = json.load(handle)
+        if partial.get("version") != PARTIAL_VERSION:
+            raise ValueError(f"{path}: unsupported partial version {partial.get('version')!r}")
+        for stage, result in partial["stages"].items():
+            if stage not in FETCH_STAGES:
+                raise ValueError(f"{path}: unknown stage {stage!r}")
+            results.setdefault(stage, []).extend(result)
+    for stage in ("x_search.bonbon", "x_search.gacha"):
+        if stage in results:
+            results[stage] = dedup_posts([results[stage]])
+    return results
 
-    enrich_x_post_content(bonbon_posts, limit=30)
-    enrich_x_post_content(gacha_posts, limit=30)
 
-    write_json(OUTPUT_DIR / "products.json", all_products)
-    write_json(OUTPUT_DIR / "sns_bonbon.json", bonbon_posts)
-    write_json(OUTPUT_DIR / "sns_gacha.json", gacha_posts)
+def enrich_feeds(bonbon_posts: list[dict], gacha_posts: list[dict]) -> tuple[list[dict], list[dict]]:
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        bonbon_future = pool.submit(run_stage, "enrich.bonbon", enrich_x_post_content, bonbon_posts)
+        gacha_future = pool.submit(run_stage, "enrich.gacha", enrich_x_post_content, gacha_posts)
+    return bonbon_future.result(), gacha_future.result()
 
+
+def publish(
+    all_products: list[dict],
+    bonbon_posts: list[dict],
+    gacha_posts: list[dict],
+    previous_products: list[dict],
+) -> None:
+    now = datetime.now(timezone.utc)
+    run_at = now.isoformat()
+    feed_cutoff = now - SNS_RETENTION
+    with METRICS.stage("merge"), HistoryStore(HISTORY_DB_PATH) as store:
+        store.record_products(merge_products(previous_products, all_products), run_at)
+        all_products = store.products_seen_at(run_at)
+
+        feeds = {"sns_bonbon": bonbon_posts, "sns_gacha": gacha_posts}
+        for name, posts in feeds.items():
+            previous_posts = store.feed_posts(name, feed_cutoff) or load_previous(OUTPUT_DIR / f"{name}.json")
+            store.record_posts(
+                name,
+                merge_posts(previous_posts, posts, now, SNS_RETENTION, is_placeholder_post),
+                run_at,
+            )
+            feeds[name] = store.feed_posts(name, feed_cutoff)
+        bonbon_posts, gacha_posts = feeds["sns_bonbon"], feeds["sns_gacha"]
+
+        store.compact(now, HISTORY_POST_RETENTION, HISTORY_OBSERVATION_RETENTION)
+
+    with METRICS.stage("write"):
+        files = {}
+        shards = {}
+        for name, payload in (
+            ("products", all_products),
+            # The history store keeps every post; the exports show one per
+            # near-duplicate cluster (restock templates, repeated exchange posts).
+            ("sns_bonbon", collapse_near_duplicates(bonbon_posts, is_collapsible_post)),
+            ("sns_gacha", collapse_near_duplicates(gacha_posts, is_collapsible_post)),
+        ):
+            files[f"{name}.json"] = write_json(OUTPUT_DIR / f"{name}.json", payload)
+            if not name.startswith("sns_"):
+                continue
+            index = build_search_index(payload, files[f"{name}.json"], infer_store_name, infer_location)
+            files[f"{name}.index.json"] = write_json(OUTPUT_DIR / f"{name}.index.json", index)
+            if SNS_SHARD_BY:
+                shards[name] = write_shards(OUTPUT_DIR, name, payload, SNS_SHARD_BY)
+        write_manifest(OUTPUT_DIR, files, shards)
+
+
+def save_state() -> None:
+    HTTP_CACHE.save()
+    CRAWL_STATE.save()
+    ENRICHMENT_CACHE.save()
+    QUERY_PLANNER.save()
+    RAFFLE_DATE_CACHE.save()
+    REFRESH_SCHEDULER.save()
+
+
+def run_update(
+    only: list[str] | None = None,
+    shard: tuple[int, int] | None = None,
+    partial_path: Path | None = None,
+    merge_paths: list[Path] | None = None,
+) -> None:
+    """Full run by default.
+
+    With partial_path the selected stages (only, and shard for the keyword
+    searches) are fetched and enriched and their results written there;
+    merge_paths publishes a set of such partials without fetching.
+    """
+    with HistoryStore(HISTORY_DB_PATH) as store:
+        # The JSON exports seed the store when the cached database is missing.
+        previous_products = store.latest_products() or load_previous(OUTPUT_DIR / "products.json")
+
+    if merge_paths:
+        publish(*combine_stages(load_partials(merge_paths), previous_products), previous_products)
+        return
+
+    stages = [stage for stage in FETCH_STAGES if not only or stage in only]
+    results = collect_stages(stages, previous_products, shard)
+    if partial_path:
+        for feed in ("bonbon", "gacha"):
+            if results.get(f"x_search.{feed}") is not None:
+                results[f"x_search.{feed}"] = run_stage(
+                    f"enrich.{feed}", enrich_x_post_content, results[f"x_search.{feed}"]
+                )
+        write_partial(partial_path, results, only, shard)
+    else:
+        all_products, bonbon_posts, gacha_posts = combine_stages(results, previous_products)
+        bonbon_posts, gacha_posts = enrich_feeds(bonbon_posts, gacha_posts)
+        publish(all_products, bonbon_posts, gacha_posts, previous_products)
+    CHECKPOINT.clear()
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Scrape shop catalogs and realtime search into data/*.json.")
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR)
+    parser.add_argument("--state-dir", type=Path, default=CACHE_DIR, help="caches, crawl state and history database")
+    parser.add_argument("--only", action="append", choices=FETCH_STAGES, metavar="STAGE", help="run only this fetch stage (repeatable)")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N", help="keyword searches: run only query shard I of N")
+    parser.add_argument("--partial", type=Path, metavar="PATH", help="write the selected stages' results here instead of publishing")
+    parser.add_argument("--merge", type=Path, nargs="+", metavar="PARTIAL", help="publish shard partials without fetching")
+    parser.add_argument(
+        "--deadline",
+        type=parse_deadline,
+        metavar="WHEN",
+        help="stop scheduling work shortly before this time (e.g. 40m) and publish what was fetched",
+    )
+    parser.add_argument("--refresh-all", action="store_true", help="fetch every source, due or not")
+    parser.add_argument(
+        "--listing-pages",
+        type=int,
+        default=LISTING_MAX_PAGES,
+        metavar="N",
+        help="listing pages read per shop without a usable sitemap",
+    )
+    parser.add_argument(
+        "--shard-sns-by",
+        choices=["day", "location"],
+        default=SNS_SHARD_BY,
+        help="also write the SNS feeds split into per-day or per-location files",
+    )
+    parser.add_argument("--fresh", action="store_true", help="discard the checkpoint of an interrupted run")
+    parser.add_argument("--record", type=Path, metavar="ARCHIVE", help="save every response to this bundle")
+    parser.add_argument("--replay", type=Path, metavar="ARCHIVE", help="serve responses from this bundle locally")
+    parser.add_argument("--replay-url", help="use an already running replay server")
+    parser.add_argument("--replay-latency", action="append", metavar="HOST=MS", help="added latency per host")
+    parser.add_argument("--replay-error-rate", action="append", metavar="HOST=RATE", help="injected error rate per host")
+    parser.add_argument("--replay-seed", type=int, default=0)
+    parser.add_argument("--metrics-dir", type=Path, help="where metrics.json / metrics.prom go (default OUTPUT_DIR/metrics)")
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=default_parse_workers(),
+        help="processes for HTML parsing; 0 parses on the fetching threads",
+    )
+    parser.add_argument("--profile-stage", metavar="STAGE", help="dump a cProfile of this stage, e.g. products.sanrio")
+    args = parser.parse_args(argv)
+    if args.merge and (args.only or args.shard or args.partial):
+        parser.error("--merge cannot be combined with --only, --shard or --partial")
+    return args
+
+
+def stop_on_signal(signum, frame) -> None:
+    BUDGET.cancel()
+    sys.exit(128 + signum)
+
+
+def main(argv: list[str] | None = None) -> int:
+    global OUTPUT_DIR, LISTING_MAX_PAGES, SNS_SHARD_BY, RECORDER, REPLAY_BASE_URL, METRICS, HOST_HEALTH, BUDGET, PARSE_POOL
+    args = parse_args(argv)
+    OUTPUT_DIR = args.output_dir
+    LISTING_MAX_PAGES = args.listing_pages
+    SNS_SHARD_BY = args.shard_sns_by
+    METRICS = RunMetrics(profile_stage=args.profile_stage)
+    HOST_HEALTH = HostHealth(max_timeout=TIMEOUT_SECONDS)
+    BUDGET = RunBudget(args.deadline, reserve=DEADLINE_RESERVE)
+    if args.state_dir != CACHE_DIR:
+        configure_state(args.state_dir)
+    REFRESH_SCHEDULER.force = args.refresh_all
+    if args.fresh:
+        CHECKPOINT.clear()
+    elif resumed := CHECKPOINT.resumed_stages:
+        print("resuming interrupted run: " + ", ".join(resumed))
+    PARSE_POOL = start_parse_pool(0 if args.merge else args.parse_workers)
+    # Cancelled workflow runs get SIGINT, then SIGTERM. Stop scheduling work
+    # at once and exit through the finally below, which flushes the
+    # checkpoint and saves the caches.
+    signal.signal(signal.SIGINT, stop_on_signal)
+    signal.signal(signal.SIGTERM, stop_on_signal)
+
+    server = None
+    if args.replay:
+        server = ReplayServer(
+            ResponseArchive.load(args.replay),
+            latency_ms=parse_host_values(args.replay_latency),
+            error_rate=parse_host_values(args.replay_error_rate),
+            seed=args.replay_seed,
+        )
+        server.start()
+        REPLAY_BASE_URL = server.base_url
+    elif args.replay_url:
+        REPLAY_BASE_URL = args.replay_url.rstrip("/")
+    if args.record:
+        RECORDER = ResponseArchive(args.record)
+
+    try:
+        run_update(args.only, args.shard, args.partial, args.merge)
+    finally:
+        if RECORDER:
+            RECORDER.save()
+        if server:
+            server.shutdown()
+        CHECKPOINT.flush()
+        save_state()
+        if PARSE_POOL:
+            PARSE_POOL.shutdown(cancel_futures=True)
+        METRICS.write(args.metrics_dir or OUTPUT_DIR / "metrics")
+        for line in HOST_HEALTH.summary():
+            print(f"[hosts] {line}")
+        for line in BUDGET.summary():
+            print(f"[stopped] {line}")
+    print(f"update finished in {METRICS.snapshot()['wallSeconds']:.2f}s")
     return 0
 
 